@@ -1 +1,7 @@
-from .crud_generator import  Context, CRUDTemplate
\ No newline at end of file
+from .crud_generator import  Context, CRUDTemplate
+from .pagination import Keyset
+from .filters import Filters
+from .projection import Projection
+from .serialization import Serializer
+from .etag import make_etag, etag_matches, not_modified, not_modified_response
+from .bulk import BulkCreateResult, BulkError, BulkUpdateResult, DeleteAllResult, bulk_update_item, read_rows, bulk_request_body
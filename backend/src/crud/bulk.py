@@ -0,0 +1,77 @@
+import json
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, create_model
+
+NDJSON = 'application/x-ndjson'
+
+
+class BulkError(BaseModel):
+    row: int
+    detail: Any
+
+
+class BulkCreateResult(BaseModel):
+    created: int = 0
+    ids: list[int] = []
+    errors: list[BulkError] = []
+
+
+class BulkUpdateResult(BaseModel):
+    updated: list[int] = []
+    missing: list[int] = []
+    forbidden: list[int] = []
+
+
+def bulk_update_item(schema: type[BaseModel]) -> type[BaseModel]:
+    """{id, changes} of a bulk update"""
+    return create_model(f'{schema.__name__}Item', id=(int, ...), changes=(schema, ...))
+
+
+class DeleteAllResult(BaseModel):
+    status: str
+    deleted: int = 0
+    progress: float = 0.0
+    job: Optional[str] = None
+
+
+def bulk_request_body(schema: type[BaseModel]) -> dict:
+    """openapi_extra for a route reading a JSON array or NDJSON of schema itself"""
+    item = {'$ref': f'#/components/schemas/{schema.__name__}'}
+    return {'requestBody': {'required': True, 'content': {
+        'application/json': {'schema': {'type': 'array', 'items': item}},
+        NDJSON: {'schema': item},
+    }}}
+
+
+async def read_rows(request: Request) -> AsyncIterator[tuple[int, Any, Optional[str]]]:
+    """Yields (row, item, error) from a JSON array or, for NDJSON, line by line as the body arrives"""
+    if not request.headers.get('content-type', '').startswith(NDJSON):
+        try:
+            items = await request.json()
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Body is not valid JSON') from None
+        if not isinstance(items, list):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Expected a JSON array')
+        for row, item in enumerate(items):
+            yield row, item, None
+        return
+
+    row = 0
+    tail = b''
+    async for data in request.stream():
+        *lines, tail = (tail + data).split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield (row, *_parse_line(line))
+                row += 1
+    if tail.strip():
+        yield (row, *_parse_line(tail))
+
+
+def _parse_line(line: bytes) -> tuple[Any, Optional[str]]:
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f'Invalid JSON: {e}'
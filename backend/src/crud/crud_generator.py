@@ -1,11 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Generic, List, Optional, Type, Union, TypeVar, TypedDict
+from typing import Any, Callable, Generic, List, Literal, Optional, Sequence, Type, Union, TypeVar, TypedDict
 
 from fastapi import APIRouter, HTTPException, status
 from fastapi.params import Depends
 from fastapi.types import DecoratedCallable
 from fastapi_sqlalchemy_toolkit import ModelManager
 from pydantic import BaseModel
+from sqlalchemy.orm import InstrumentedAttribute
 from .openapi_responses import not_found_response
 
 NOT_FOUND = HTTPException(404, "Item not found")
@@ -30,6 +31,27 @@ class Context(TypedDict, total=False):
     update_route: bool
     delete_one_route: bool
     delete_all_route: bool
+    # GET /export streaming NDJSON or CSV, off by default
+    export_route: bool
+    # POST /bulk of a JSON array or NDJSON, off by default
+    bulk_create_route: bool
+    # PATCH /bulk of [{id, changes}], off by default
+    bulk_update_route: bool
+    # list and get one return raw JSON dumped by precompiled TypeAdapters, skipping
+    # the response_model validation and encoding of FastAPI. Off by default
+    fast_serialization: bool
+    # seconds list and get one responses are kept in Redis, off by default. Writes through
+    # the router drop them, anything else writing the table has to invalidate the cache too
+    cache_ttl: int
+    # columns the list and export routes filter by (repeated query parameters, IN) and the list
+    # route sorts by (sort=key or sort=-key). Each should lead an index
+    filter_fields: Sequence[InstrumentedAttribute]
+    sort_fields: Sequence[InstrumentedAttribute]
+    # GET /page of keyset pages ordered by cursor_column (id by default), next to the list route. Off by default
+    pagination: bool
+    cursor_column: InstrumentedAttribute
+    # total of the pages: exact count(*), estimated from planner statistics or none (default)
+    count_strategy: Literal['exact', 'estimated', 'none']
 
 
 class CRUDTemplate(APIRouter):
@@ -55,12 +77,27 @@ class CRUDTemplate(APIRouter):
         if self.ctx.get('get_all_route', True):
             self._get_all()
 
+        # before get one, /{id} would catch /export
+        if self.ctx.get('export_route', False):
+            self._export()
+
+        # same for /page
+        if self.ctx.get('pagination', False):
+            self._get_page()
+
         if self.ctx.get('create_route', True):
             self._create()
 
+        if self.ctx.get('bulk_create_route', False):
+            self._bulk_create()
+
         if self.ctx.get('get_one_route', True):
             self._get_one()
 
+        # before update, /{id} would catch /bulk
+        if self.ctx.get('bulk_update_route', False):
+            self._bulk_update()
+
         if self.ctx.get('update_route', True):
             self._update()
 
@@ -92,6 +129,14 @@ class CRUDTemplate(APIRouter):
     def _get_all(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
 
+    @abstractmethod
+    def _export(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _get_page(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        raise NotImplementedError
+
     @abstractmethod
     def _get_one(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
@@ -100,6 +145,14 @@ class CRUDTemplate(APIRouter):
     def _create(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
 
+    @abstractmethod
+    def _bulk_create(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _bulk_update(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        raise NotImplementedError
+
     @abstractmethod
     def _update(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
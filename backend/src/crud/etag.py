@@ -0,0 +1,33 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response, status
+
+not_modified_response = {
+    status.HTTP_304_NOT_MODIFIED: {
+        'description': 'Not modified since the ETag in If-None-Match',
+    },
+}
+
+
+def make_etag(version: Any, fields: Optional[list[str]] = None) -> str:
+    """Weak ETag of a representation, fields= responses get their own"""
+    if fields is None:
+        return f'W/"{version}"'
+    digest = hashlib.blake2b(','.join(fields).encode(), digest_size=4).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    # If-None-Match compares weakly
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in header.split(','))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
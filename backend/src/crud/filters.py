@@ -0,0 +1,75 @@
+from inspect import Parameter, Signature
+from typing import Any, Callable, Literal, Optional, Sequence
+
+from fastapi import Query
+from pydantic import BaseModel, Field, create_model
+from sqlalchemy import Table, UniqueConstraint, inspect
+from sqlalchemy.orm import InstrumentedAttribute
+
+
+class Filters:
+    """Filter and sort columns declared for a list route, read as one model of query parameters.
+
+    A filter takes repeated values, ?login=a&login=b is login IN ('a', 'b'). sort takes a
+    column key, descending with a leading minus.
+    """
+
+    def __init__(self, model: Any, filters: Sequence[InstrumentedAttribute] = (),
+                 sort: Sequence[InstrumentedAttribute] = ()):
+        self.table: Table = inspect(model).local_table
+        self.columns = {column.key: column for column in filters}
+        self.sort_columns = {column.key: column for column in sort}
+
+        fields = {key: (Optional[list[column.type.python_type]], Field(None, description=f'Any of these {key}'))
+                  for key, column in self.columns.items()}
+        if self.sort_columns:
+            orders = [order for key in self.sort_columns for order in (key, f'-{key}')]
+            fields['sort'] = (Optional[Literal[tuple(orders)]], Field(None, description='-key sorts descending'))
+        self.query: Optional[type[BaseModel]] = create_model(f'{model.__name__}Filters', **fields) if fields else None
+
+    def dependency(self) -> Callable:
+        """Reads the query model, one documented query parameter per field"""
+        query = self.query
+
+        async def dependency(**params) -> Optional[BaseModel]:
+            return query(**params) if query is not None else None
+
+        dependency.__signature__ = Signature([
+            Parameter(key, Parameter.KEYWORD_ONLY, annotation=field.annotation,
+                      default=Query(None, description=field.description))
+            for key, field in (query.model_fields.items() if query is not None else ())
+        ])
+        return dependency
+
+    def expressions(self, params: Optional[BaseModel]) -> dict:
+        """filter_expressions of ModelManager.list, it skips the None values"""
+        if params is None:
+            return {}
+        return {column.in_: getattr(params, key) for key, column in self.columns.items()}
+
+    def conditions(self, params: Optional[BaseModel]) -> list:
+        """The same filters as where clauses, for statements built by hand"""
+        if params is None:
+            return []
+        values = ((column, getattr(params, key)) for key, column in self.columns.items())
+        return [column.in_(value) for column, value in values if value is not None]
+
+    def order_by(self, params: Optional[BaseModel]):
+        sort = getattr(params, 'sort', None)
+        if sort is None:
+            return None
+        if sort.startswith('-'):
+            return self.sort_columns[sort[1:]].desc()
+        return self.sort_columns[sort].asc()
+
+    def unindexed(self) -> list[str]:
+        """Declared columns no index of the table starts with, each request on them scans the table
+
+        Partial indexes don't count, they serve only the queries matching their predicate.
+        """
+        indexes = [self.table.primary_key,
+                   *(index for index in self.table.indexes if index.dialect_kwargs.get('postgresql_where') is None),
+                   *(constraint for constraint in self.table.constraints if isinstance(constraint, UniqueConstraint))]
+        leading = {column.key for column in self.table.columns if column.unique}
+        leading |= {next(iter(index.columns)).key for index in indexes if len(index.columns)}
+        return sorted((self.columns.keys() | self.sort_columns.keys()) - leading)
@@ -0,0 +1,60 @@
+import json
+from datetime import date, datetime
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+
+INVALID_CURSOR = HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor value")
+
+
+class Keyset:
+    """Keyset pagination over an indexed, not null column, the primary key breaks ties.
+
+    A cursor holds the ordering values of the last row of a page, the next page starts
+    right after them through the index, so every page costs the same as the first one.
+    """
+
+    def __init__(self, column: InstrumentedAttribute, pk: InstrumentedAttribute):
+        self.columns = (column,) if column is pk else (column, pk)
+
+    def apply(self, stmt: Select, cursor: Optional[str], size: int) -> Select:
+        # one row more tells whether there is a next page
+        stmt = stmt.order_by(*self.columns).limit(size + 1)
+        if cursor is None:
+            return stmt
+
+        values = self.decode(cursor)
+        if len(self.columns) == 1:
+            return stmt.where(self.columns[0] > values[0])
+        return stmt.where(tuple_(*self.columns) > tuple_(*values))
+
+    def encode(self, row: Any) -> str:
+        return json.dumps([self._dump(getattr(row, column.key)) for column in self.columns])
+
+    def decode(self, cursor: str) -> list:
+        try:
+            values = json.loads(cursor)
+            if not isinstance(values, list) or len(values) != len(self.columns):
+                raise ValueError(cursor)
+            return [self._load(column, value) for column, value in zip(self.columns, values)]
+        except (ValueError, TypeError):
+            raise INVALID_CURSOR from None
+
+    @staticmethod
+    def _dump(value: Any) -> Any:
+        return value.isoformat() if isinstance(value, date) else value
+
+    @staticmethod
+    def _load(column: InstrumentedAttribute, value: Any) -> Any:
+        python_type = column.type.python_type
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        if python_type is date:
+            return date.fromisoformat(value)
+        if python_type is float and isinstance(value, int):
+            return float(value)
+        if not isinstance(value, python_type):
+            raise ValueError(value)
+        return value
@@ -0,0 +1,46 @@
+from typing import Any, Iterable, Optional, Type
+
+from fastapi import HTTPException, status
+from fastapi_sqlalchemy_toolkit import make_partial_model
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+class Projection:
+    """Columns of a model to load for a response schema, or for the fields= subset of it.
+
+    Without fields only the columns of the schema are loaded, with fields the response
+    holds just those fields. required columns (primary key, acl columns) are always loaded.
+    """
+
+    def __init__(self, model: Any, schema: Type[BaseModel], required: Iterable[str] = ()):
+        mapper = inspect(model)
+        self.model = model
+        self.columns = {attr.key for attr in mapper.column_attrs}
+        self.fields = list(schema.model_fields)
+        self.required = {column.key for column in mapper.primary_key} | set(required)
+        self.partial = make_partial_model(schema)
+
+    def parse(self, fields: Optional[str]) -> Optional[list[str]]:
+        if fields is None:
+            return None
+        requested = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in requested if field not in self.fields]
+        if unknown or not requested:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unknown fields: {', '.join(unknown)}")
+        return requested
+
+    def keys(self, fields: Optional[list[str]] = None) -> set[str]:
+        return {field for field in (fields or self.fields) if field in self.columns} | self.required
+
+    def options(self, fields: Optional[list[str]] = None) -> list:
+        return self.load(self.keys(fields))
+
+    def load(self, keys: Iterable[str]) -> list:
+        return [load_only(*(getattr(self.model, key) for key in sorted(keys)))]
+
+    def render(self, obj: Any, fields: list[str]) -> dict:
+        # only the loaded attributes are read, others would lazy load outside of the greenlet
+        data = {field: getattr(obj, field) for field in fields}
+        return self.partial.model_validate(data).model_dump(mode='json', include=set(fields))
@@ -0,0 +1,32 @@
+from typing import Any, Iterable, Type
+
+from pydantic import BaseModel, TypeAdapter
+
+
+class Serializer:
+    """ORM objects to JSON bytes through TypeAdapters built once per schema.
+
+    A returned object is validated by FastAPI against response_model, dumped to python
+    and encoded by json.dumps. Here validation and the JSON dump both run in pydantic-core,
+    no intermediate dicts.
+    """
+
+    def __init__(self, schema: Type[BaseModel]):
+        self.one = TypeAdapter(schema)
+        self.many = TypeAdapter(list[schema])
+        self.fields = {field.alias or name for name, field in schema.model_fields.items()}
+
+    def source(self, obj: Any) -> Any:
+        # loaded columns sit in the __dict__ of the instance, reading them there skips the
+        # instrumented attributes; anything not loaded yet goes through getattr
+        values = getattr(obj, '__dict__', None)
+        if values is not None and self.fields <= values.keys():
+            return values
+        return obj
+
+    def dump(self, obj: Any) -> bytes:
+        return self.one.dump_json(self.one.validate_python(self.source(obj), from_attributes=True))
+
+    def dump_many(self, objs: Iterable[Any]) -> bytes:
+        return self.many.dump_json(self.many.validate_python([self.source(obj) for obj in objs],
+                                                             from_attributes=True))
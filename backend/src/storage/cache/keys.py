@@ -0,0 +1,35 @@
+# Hash of session id -> '{refresh exp}:{refresh jti}', expires with the latest refresh token
+def user_sessions_key(user_id: int) -> str:
+    return f'user_sessions:{user_id}'
+
+
+def principals_key(user_id: int) -> str:
+    return f'principals:{user_id}'
+
+
+# Session store in Redis mode: id counter and write-behind queues drained by the worker
+SESSION_IDS = 'sessions:id'
+PENDING_SESSIONS = 'sessions:pending'
+REVOKED_SESSIONS = 'sessions:revoked'
+
+# Stream of revoked session ids with the expiry of their last access token
+REVOCATIONS = 'sessions.revocations'
+
+
+# Serialized GET responses of CRUD routes, per model tag, and the set of them dropped on writes to the model
+def response_key(tag: str, digest: str) -> str:
+    return f'responses:{tag}:{digest}'
+
+
+def response_tag_key(tag: str) -> str:
+    return f'responses:{tag}'
+
+
+# Bumped by every invalidation of the tag, a response read before it isn't stored after it
+def response_generation_key(tag: str) -> str:
+    return f'response_generations:{tag}'
+
+
+# Streams of user changes read by the other services, action is create, update or delete
+def user_events_key(action: str) -> str:
+    return f'accounts.{action}'
@@ -1,21 +1,295 @@
-from typing import Literal
-from storage.db.models.users import User
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Literal, Optional, Sequence, TYPE_CHECKING
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from .keys import principals_key, user_sessions_key, SESSION_IDS, PENDING_SESSIONS, REVOKED_SESSIONS, \
+    REVOCATIONS, user_events_key, response_tag_key, response_generation_key
+
+if TYPE_CHECKING:
+    # the worker uses the client without the web models
+    from storage.db.models.users import User
+
+# KEYS: user sessions, principals; ARGV: session id, presented value, new value, ttl
+ROTATE_SESSION = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return false
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return {1, redis.call('GET', KEYS[2])}
+"""
+
+# Cached principals are {"roles": [...], "rv": roles version}, an invalidation leaves {"rv": new roles version}
+# behind so principals read from the database before it can't be stored after it
+
+# KEYS: principals; ARGV: principals, ttl
+STORE_PRINCIPALS = """
+local stored = redis.call('GET', KEYS[1])
+if stored and cjson.decode(stored)['rv'] > cjson.decode(ARGV[1])['rv'] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS: session ids counter; ARGV: lowest value the counter may have
+SEED_SESSION_IDS = """
+local current = tonumber(redis.call('GET', KEYS[1]))
+if not current or current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+    return tonumber(ARGV[1])
+end
+return current
+"""
+
+# KEYS: principals, user sessions; ARGV: roles version
+INVALIDATE_PRINCIPALS = """
+local ttl = redis.call('TTL', KEYS[2])
+if ttl > 0 then
+    redis.call('SET', KEYS[1], cjson.encode({rv = tonumber(ARGV[1])}), 'EX', ttl)
+else
+    -- no session left to refresh
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+# KEYS: user sessions, principals, session ids counter, pending sessions, revoked sessions
+# ARGV: user id, value, principals, ttl, now, session id (empty to allocate one and write the row behind)
+OPEN_SESSION = """
+local sid = ARGV[6]
+local write_behind = sid == ''
+if write_behind then
+    sid = redis.call('INCR', KEYS[3])
+    redis.call('RPUSH', KEYS[4], sid .. ':' .. ARGV[1])
+end
+-- the hash expires as a whole, sessions with an expired refresh token are dropped here
+local sessions = redis.call('HGETALL', KEYS[1])
+for i = 1, #sessions, 2 do
+    local exp = tonumber(string.match(sessions[i + 1], '^%d+'))
+    if not exp or exp <= tonumber(ARGV[5]) then
+        redis.call('HDEL', KEYS[1], sessions[i])
+        if write_behind then
+            redis.call('RPUSH', KEYS[5], sessions[i])
+        end
+    end
+end
+redis.call('HSET', KEYS[1], sid, ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+local stored = redis.call('GET', KEYS[2])
+if not stored or cjson.decode(stored)['rv'] <= cjson.decode(ARGV[3])['rv'] then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+end
+return sid
+"""
+
+# KEYS: user sessions, revoked sessions, revocations stream
+# ARGV: whether the worker has to delete the rows, access tokens expiry, oldest revocation id to keep
+REVOKE_SESSIONS = """
+local sids = redis.call('HKEYS', KEYS[1])
+redis.call('DEL', KEYS[1])
+if ARGV[1] == '1' then
+    -- unpack is limited by the Lua stack, users may have thousands of sessions
+    for i = 1, #sids, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(sids, i, math.min(i + 999, #sids)))
+    end
+end
+for _, sid in ipairs(sids) do
+    redis.call('XADD', KEYS[3], 'MINID', '~', ARGV[3], '*', 'sid', sid, 'exp', ARGV[2])
+end
+return sids
+"""
+
+# KEYS: response, tag set of cached responses, tag generation; ARGV: generation read before the response was made,
+# ttl, field, value, ...
+STORE_RESPONSE = """
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+-- the tag set outlives none of its keys, expired members are just deleted twice
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: tag set of cached responses, tag generation
+INVALIDATE_RESPONSES = """
+redis.call('INCR', KEYS[2])
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+redis.call('DEL', KEYS[1])
+return #keys
+"""
+
+
+class RoundTrips:
+    count = 0
+
+
+# requests sent to Redis by the current task, counted by RedisClient where they are sent
+_round_trips: ContextVar[Optional[RoundTrips]] = ContextVar('redis_round_trips', default=None)
+
+
+@contextmanager
+def count_round_trips():
+    """Counts the Redis round trips of the block, nested blocks count into the outer one as well"""
+    outer = _round_trips.get()
+    trips = RoundTrips()
+    token = _round_trips.set(trips)
+    try:
+        yield trips
+    finally:
+        _round_trips.reset(token)
+        if outer is not None:
+            outer.count += trips.count
+
+
+def _round_trip():
+    trips = _round_trips.get()
+    if trips is not None:
+        trips.count += 1
+
+
+class CountingPipeline(Pipeline):
+    async def immediate_execute_command(self, *args, **options):
+        _round_trip()
+        return await super().immediate_execute_command(*args, **options)
+
+    async def execute(self, raise_on_error: bool = True):
+        if self.command_stack:
+            _round_trip()
+        return await super().execute(raise_on_error)
+
+
+def revocations_since(timestamp: float) -> str:
+    """Stream id of the first revocation made after the timestamp"""
+    return f'{int(timestamp * 1000)}-0'
 
 
 class RedisClient(Redis):
-    channel = 'accounts'
+    # Script objects by source, clients are made per request and the sha is the same for all of them
+    _scripts: dict[str, AsyncScript] = {}
+
+    async def execute_command(self, *args, **options):
+        _round_trip()
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> CountingPipeline:
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    def script(self, source: str) -> AsyncScript:
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.register_script(source)
+        return script
+
+    async def broadcast_user_cud_actions(self, user: 'User', action: Literal['create', 'update', 'delete']):
+        await self.broadcast_users_cud_actions([user], action)
+
+    async def broadcast_users_cud_actions(self, users: Sequence['User'],
+                                          action: Literal['create', 'update', 'delete']):
+        invalidate = self.script(INVALIDATE_PRINCIPALS)
+        async with self.pipeline(transaction=False) as pipe:
+            for user in users:
+                pipe.xadd(user_events_key(action),
+                          {'user_id': user.id, 'login': user.login, 'is_active': int(user.is_active),
+                           'is_superuser': int(user.is_superuser), 'is_verified': int(user.is_verified)})
+                # cached principals are stale after any change of the user
+                if action == 'delete':
+                    pipe.delete(principals_key(user.id))
+                else:
+                    await invalidate(client=pipe, keys=[principals_key(user.id), user_sessions_key(user.id)],
+                                     args=[user.roles_version])
+            await pipe.execute()
+
+    async def seed_session_ids(self, last_id: int) -> int:
+        """Moves the session id counter up to last_id if it is below, returns the counter"""
+        script = self.script(SEED_SESSION_IDS)
+        return int(await script(client=self, keys=[SESSION_IDS], args=[last_id]))
+
+    async def store_principals(self, user_id: int, principals: str, ttl: int) -> bool:
+        """Caches principals read from the database, unless they were invalidated for a newer roles version"""
+        script = self.script(STORE_PRINCIPALS)
+        return bool(await script(client=self, keys=[principals_key(user_id)], args=[principals, ttl]))
+
+    async def open_session(self, user_id: int, value: str, principals: str, ttl: int,
+                           sid: Optional[int] = None) -> int:
+        """Stores a new session of the user.
+
+        Without a session id one is allocated and the sessions row is queued for the worker.
+        """
+        script = self.script(OPEN_SESSION)
+        keys = [user_sessions_key(user_id), principals_key(user_id), SESSION_IDS, PENDING_SESSIONS, REVOKED_SESSIONS]
+        return int(await script(client=self, keys=keys, args=[user_id, value, principals, ttl, int(time.time()),
+                                                              '' if sid is None else sid]))
+
+    async def revoke_sessions(self, user_id: int, write_behind: bool, access_lifetime: int) -> list[int]:
+        """Drops every session of the user and announces their access tokens as revoked.
+
+        Returns the revoked session ids.
+        """
+        script = self.script(REVOKE_SESSIONS)
+        now = time.time()
+        sids = await script(client=self, keys=[user_sessions_key(user_id), REVOKED_SESSIONS, REVOCATIONS],
+                            args=[int(write_behind), int(now + access_lifetime), revocations_since(now - access_lifetime)])
+        return [int(sid) for sid in sids]
+
+    async def rotate_session(self, sid: int, user_id: int, value: str, new_value: str,
+                             ttl: int) -> tuple[bool, Optional[str]]:
+        """Swaps the stored refresh token of the session if the presented one is current.
+
+        Returns whether the session was rotated and the cached principals of the user,
+        which are None if they were invalidated (roles missing).
+        """
+        script = self.script(ROTATE_SESSION)
+        result = await script(client=self, keys=[user_sessions_key(user_id), principals_key(user_id)],
+                              args=[sid, value, new_value, ttl])
+        if result is None:
+            return False, None
+        return True, result[1]
+
+    async def cached_response(self, tag: str, key: str) -> tuple[dict[str, str], str]:
+        """The cached response, empty if there is none, and the generation of the tag to store a new one with"""
+        async with self.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.get(response_generation_key(tag))
+            cached, generation = await pipe.execute()
+        return cached, generation or '0'
+
+    async def cache_response(self, tag: str, key: str, mapping: dict[str, str], ttl: int, generation: str) -> bool:
+        """Stores the response unless the tag was invalidated since its generation was read"""
+        script = self.script(STORE_RESPONSE)
+        args = [generation, ttl, *(item for pair in mapping.items() for item in pair)]
+        return bool(await script(client=self, keys=[key, response_tag_key(tag), response_generation_key(tag)],
+                                 args=args))
 
-    async def broadcast_user_cud_actions(self, user: User, action: Literal['create', 'update', 'delete']):
-        await self.xadd(f'{self.channel}.{action}',
-                        {'user_id': user.id, 'email': user.email, 'is_active': int(user.is_active),
-                         'is_superuser': int(user.is_superuser), 'is_verified': int(user.is_verified)})
+    async def invalidate_responses(self, tag: str) -> int:
+        """Drops every cached response of the tag, returns how many there were"""
+        script = self.script(INVALIDATE_RESPONSES)
+        return int(await script(client=self, keys=[response_tag_key(tag), response_generation_key(tag)]))
 
-    async def listen(self, names: list[str]):
-        ids = {name: '$' for name in names}
+    async def listen(self, names: list[str], start_ids: Optional[dict[str, str]] = None):
+        """Yields (stream, payload) of entries added to the streams, or after start_ids"""
+        start_ids = start_ids or {}
+        # '$' is resolved by every XREAD, streams missing from a response would skip entries added
+        # meanwhile. Each stream starts at its last entry instead, 0-0 for a stream not made yet
+        async with self.pipeline(transaction=False) as pipe:
+            for name in names:
+                pipe.xrevrange(name, count=1)
+            last = await pipe.execute()
+        ids = {name: entries[0][0] if entries else '0-0' for name, entries in zip(names, last)}
+        ids.update(start_ids)
         while True:
-            response = await self.xread(ids, count=1, block=0)
-            key, messages = response[0]
-            last_id, payload = messages[0]
-            ids[key] = last_id
-            yield key, payload
+            response = await self.xread(ids, block=0)
+            # every stream with new entries is in the response, each must move past all of them
+            for key, messages in response:
+                for last_id, payload in messages:
+                    ids[key] = last_id
+                    yield key, payload
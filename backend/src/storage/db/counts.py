@@ -0,0 +1,36 @@
+import json
+from typing import Optional
+
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def exact_count(session: AsyncSession, stmt: Select) -> int:
+    return await session.scalar(select(func.count()).select_from(stmt.order_by(None).limit(None).subquery()))
+
+
+async def estimated_count(session: AsyncSession, stmt: Select, table_name: str, exact_below: int) -> int:
+    """Rows of stmt as the planner sees them, counted exactly when there are few of them.
+
+    Unfiltered statements take reltuples of the table (-1 before the first ANALYZE), filtered
+    ones the row estimate of EXPLAIN. Both are as fresh as the last (auto)analyze.
+    """
+    if stmt.whereclause is None:
+        estimate = await session.scalar(text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)'),
+                                        {'name': table_name})
+    else:
+        estimate = await explain_rows(session, stmt)
+    if estimate is None or estimate < exact_below:
+        return await exact_count(session, stmt)
+    return int(estimate)
+
+
+async def explain_rows(session: AsyncSession, stmt: Select) -> Optional[int]:
+    connection = await session.connection()
+    compiled = stmt.order_by(None).limit(None).compile(dialect=connection.dialect,
+                                                        compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    plan = (await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', params)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
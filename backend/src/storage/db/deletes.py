@@ -0,0 +1,48 @@
+from typing import Awaitable, Callable, Optional, Sequence
+
+from sqlalchemy import Row, column, delete, func, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Used by the web app and the worker, which doesn't ship the models: core statements on a lightweight table
+
+# Columns of deleted users returned for the accounts.delete events
+USER_EVENT_COLUMNS = ('login', 'is_active', 'is_superuser', 'is_verified')
+
+
+async def count_rows(session: AsyncSession, table_name: str, limit: Optional[int] = None) -> int:
+    """Counts up to limit + 1 rows, enough to tell small tables from huge ones without a full scan"""
+    ids = select(table(table_name, column('id')).c.id)
+    if limit is not None:
+        ids = ids.limit(limit + 1)
+    return await session.scalar(select(func.count()).select_from(ids.subquery()))
+
+
+async def delete_in_chunks(
+        session: AsyncSession,
+        table_name: str,
+        chunk_size: int,
+        exclude_id: Optional[int] = None,
+        returning: Sequence[str] = (),
+        on_chunk: Optional[Callable[[Sequence[Row], int], Awaitable[None]]] = None,
+) -> int:
+    """Deletes every row but exclude_id, one committed DELETE per chunk of ids.
+
+    Dependent rows go with the ON DELETE CASCADE foreign keys. Short transactions keep locks and
+    WAL per statement bounded, on_chunk gets the deleted rows and the running count after each commit.
+    """
+    rows = table(table_name, column('id'), *(column(name) for name in returning))
+    ids = select(rows.c.id).order_by(rows.c.id).limit(chunk_size)
+    if exclude_id is not None:
+        ids = ids.where(rows.c.id != exclude_id)
+    stmt = delete(rows).where(rows.c.id.in_(ids.scalar_subquery())).returning(rows.c.id, *(
+        rows.c[name] for name in returning))
+
+    deleted = 0
+    while True:
+        chunk = (await session.execute(stmt)).all()
+        await session.commit()
+        deleted += len(chunk)
+        if on_chunk is not None and chunk:
+            await on_chunk(chunk, deleted)
+        if len(chunk) < chunk_size:
+            return deleted
@@ -1,7 +1,8 @@
 from datetime import datetime
+from typing import Any, Callable, Iterable, NamedTuple, Optional
 from uuid import UUID, uuid4
 
-from sqlalchemy import DateTime, func, Integer
+from sqlalchemy import DateTime, func, Integer, text
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -30,3 +31,49 @@ class CreatedAtMixin:
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+
+
+class VersionMixin:
+    # bumped by every UPDATE of the row, ETags are built from it
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default='1', onupdate=text('version + 1'))
+    # the new version comes back with RETURNING of the UPDATE
+    __mapper_args__ = {'eager_defaults': True}
+
+
+class RowPrincipal(NamedTuple):
+    """Principal built from the row in acl rules, f'user:{self.login}' is RowPrincipal('user:', login).
+
+    match is a column compared with IN, or a callable taking the values and returning a predicate (joins).
+    values gives the values of a loaded row, by default the matched column of it.
+    """
+    prefix: str
+    match: Any
+    values: Optional[Callable[[Any], Iterable[Any]]] = None
+
+    def principals(self, row) -> list[str]:
+        values = self.values(row) if self.values is not None else [getattr(row, self.match.key)]
+        return [f'{self.prefix}{value}' for value in values]
+
+
+class ACLMixin:
+    """__acl__ of a row and __sql_acl__ of the table, both made from the rules of __acl_rules__
+
+    List filters and single row checks then can't decide differently.
+    """
+
+    @classmethod
+    def __acl_rules__(cls) -> list[tuple[str, Any, Any]]:
+        raise NotImplementedError
+
+    @classmethod
+    def __sql_acl__(cls):
+        return cls.__acl_rules__()
+
+    def __acl__(self):
+        acl = []
+        for action, principal, permissions in self.__acl_rules__():
+            if isinstance(principal, RowPrincipal):
+                acl.extend((action, row_principal, permissions) for row_principal in principal.principals(self))
+            else:
+                acl.append((action, principal, permissions))
+        return acl
@@ -6,5 +6,5 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 class Session(IDMixin, Base):
     __tablename__ = 'sessions'
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
     user: Mapped['User'] = relationship(back_populates='sessions', cascade='all, delete')
\ No newline at end of file
@@ -1,12 +1,14 @@
 from fastapi_permissions import Allow, Deny, All, Authenticated
-from sqlalchemy import SmallInteger, ForeignKey, String, Boolean, Float, DateTime
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import SmallInteger, ForeignKey, String, Boolean, Float, DateTime, Integer, Index, text, select
+from sqlalchemy.orm import Mapped, mapped_column, relationship, column_property
 
-from .base import Base, IDMixin
+from .base import Base, IDMixin, VersionMixin, RowPrincipal, ACLMixin
 
 
-class User(IDMixin, Base):
+class User(ACLMixin, IDMixin, VersionMixin, Base):
     __tablename__ = 'users'
+    # deactivated users are few, lists filtered by is_active=false find them here
+    __table_args__ = (Index('ix_users_inactive', 'is_active', postgresql_where=text('NOT is_active')),)
 
     phone: Mapped[int] = mapped_column(String(length=20), unique=True, nullable=False)
     login: Mapped[str] = mapped_column(String(length=200), nullable=False, unique=True)
@@ -23,21 +25,28 @@ class User(IDMixin, Base):
     is_superuser: Mapped[bool] = mapped_column(Boolean, default=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     is_verified: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Bumped whenever the principals of the user change, tokens carry it as `rv`
+    roles_version: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
     roles: Mapped[list['Role']] = relationship(back_populates='users', secondary='user_roles', cascade='all, delete')
     files: Mapped[list['File']] = relationship(back_populates='user', secondary='user_files', cascade='all, delete')
     sessions: Mapped[list['Session']] = relationship(back_populates='user', cascade='all, delete')
 
     def _get_user_roles(self, roles: list['Role']):
-        return [role.name for role in roles] + ['role:admin'] if self.is_superuser else []
+        # owners of rows match the rules on user:<login>
+        return [f'user:{self.login}'] + [role.name for role in roles] + (['role:admin'] if self.is_superuser else [])
 
     async def principals(self):
         roles = await self.awaitable_attrs.roles
         return self._get_user_roles(roles)
 
+    def __acl_key__(self):
+        # what __acl__ depends on, compiled acls are cached by it
+        return self.login
 
-    def __acl__(self):
+    @classmethod
+    def __acl_rules__(cls):
         return [
-            (Allow, f'user:{self.login}', 'view'),
+            (Allow, RowPrincipal('user:', cls.login), 'view'),
             (Allow, 'role:admin', All),
             (Allow, 'role:consumer', 'view'),
             (Allow, Authenticated, 'batch')
@@ -50,33 +59,53 @@ class UserRole(IDMixin, Base):
     role_id: Mapped[int] = mapped_column(ForeignKey('roles.id', ondelete='CASCADE'))
 
 
-class Role(IDMixin, Base):
+class Role(ACLMixin, IDMixin, VersionMixin, Base):
     __tablename__ = 'roles'
     name: Mapped[str] = mapped_column(String(length=90), unique=True)
     users: Mapped[list['User']] = relationship(back_populates='roles', secondary='user_roles')
 
-    def __acl__(self):
+    def __acl_key__(self):
+        return self.name
+
+    @classmethod
+    def __acl_rules__(cls):
         return [
-            (Allow, f'{self.name}', 'view'),
+            (Allow, RowPrincipal('', cls.name), 'view'),
             (Allow, 'role:admin', All),
         ]
 
 
-class File(IDMixin, Base):
+class File(ACLMixin, IDMixin, VersionMixin, Base):
     __tablename__ = 'files'
-    name: Mapped[str] = mapped_column(String, nullable=True)
+    name: Mapped[str] = mapped_column(String, nullable=True, index=True)
     file_path: Mapped[str] = mapped_column(String, nullable=False)
     user: Mapped[list['User']] = relationship(back_populates='files', secondary='user_files', cascade='all, delete')
+    # the owners are in the acl, their logins come with the files as lazy loads can't happen there
+    owners: Mapped[list['UserFile']] = relationship(viewonly=True, lazy='selectin')
+
+    def __acl_key__(self):
+        return tuple(sorted(owner.login for owner in self.owners))
 
-    def __acl__(self):
+    @classmethod
+    def __acl_rules__(cls):
         return [
-            (Allow, f'role:owner', 'view'),
+            (Allow, RowPrincipal('user:', cls.owned_by, lambda file: [owner.login for owner in file.owners]), 'view'),
+            (Allow, 'role:owner', 'view'),
             (Allow, 'role:admin', All),
         ]
 
+    @classmethod
+    def owned_by(cls, logins):
+        return cls.id.in_(
+            select(UserFile.file_id).join(User, User.id == UserFile.user_id).where(User.login.in_(logins))
+        )
 
 
 class UserFile(IDMixin, Base):
     __tablename__ = 'user_files'
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
-    file_id: Mapped[int] = mapped_column(ForeignKey('files.id', ondelete='CASCADE'))
\ No newline at end of file
+    file_id: Mapped[int] = mapped_column(ForeignKey('files.id', ondelete='CASCADE'))
+
+
+# login of the owner for File.__acl__, without loading the user row
+UserFile.login = column_property(select(User.login).where(User.id == UserFile.user_id).scalar_subquery())
\ No newline at end of file
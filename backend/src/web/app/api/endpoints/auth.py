@@ -7,15 +7,17 @@ from fastapi_users.authentication import AuthenticationBackend, Authenticator, S
 from fastapi_users.openapi import OpenAPIResponseType
 from fastapi_users.router.common import ErrorCode, ErrorModel
 from typing import Annotated
-from ...authentication.strategy import JWTStrategy
+from ...authentication.strategy import JWTStrategy, list_sessions, revoke_sessions
 from ...utils.users import authenticator, backend, user_manager
 from ...authentication.transport import TokenResponse
 from ...dependencies.session import get_session
+from crud.openapi_responses import missing_token_or_inactive_user_response
 
 r = APIRouter()
 get_current_user_token = authenticator.current_user_token(
     active=True,
 )
+get_current_active_user = authenticator.current_user(active=True)
 
 login_responses: OpenAPIResponseType = {
     status.HTTP_400_BAD_REQUEST: {
@@ -92,10 +94,32 @@ async def logout(
 
 @r.post(
     "/refresh_token", name=f"auth:{backend.name}.refresh",
-    responses={**backend.transport.get_openapi_login_responses_success()},
+    responses={**backend.transport.get_openapi_login_responses_success(), **missing_token_or_inactive_user_response},
     response_model=TokenResponse
 )
 async def refresh(refresh_token: Annotated[str, Body(embed=True)],
                   strategy: Strategy[models.UP, models.ID] = Depends(backend.get_strategy), ):
     strategy: JWTStrategy
-    return await strategy.refresh_token(refresh_token)
+    tokens = await strategy.refresh_token(refresh_token)
+    if tokens is None:
+        # revoked, expired or already rotated refresh token
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return tokens
+
+
+@r.get(
+    "/sessions", name=f"auth:{backend.name}.sessions",
+    response_model=list[int],
+    responses={**missing_token_or_inactive_user_response},
+)
+async def sessions(user=Depends(get_current_active_user)):
+    return await list_sessions(user.id)
+
+
+@r.delete(
+    "/sessions", name=f"auth:{backend.name}.logout_everywhere",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={**missing_token_or_inactive_user_response},
+)
+async def logout_everywhere(user=Depends(get_current_active_user)):
+    await revoke_sessions(user.id)
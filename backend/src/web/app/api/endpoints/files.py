@@ -4,8 +4,14 @@ from crud import Context
 from ...dependencies.session import get_session
 from ...schemas.files import FileCreate, FileRead, FileUpdate
 from ...utils.crud import CrudAPIRouter
+from ...conf import settings
 
 files_manager = FilesManager(File)
 
 r = CrudAPIRouter(Context(schema=FileRead, create_schema=FileCreate, update_schema=FileUpdate,
-                      manager=files_manager, get_session=get_session))
+                      manager=files_manager, get_session=get_session, export_route=True,
+                      bulk_create_route=True, bulk_update_route=True, fast_serialization=True,
+                      cache_ttl=settings.RESPONSE_CACHE_TTL,
+                      # GET /page of keyset pages in id order, the list stays as it is
+                      pagination=True, cursor_column=File.id, count_strategy='estimated',
+                      filter_fields=[File.name], sort_fields=[File.id, File.name]))
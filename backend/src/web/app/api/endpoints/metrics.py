@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from crud.openapi_responses import auth_responses
+from ...dependencies.user import get_current_user
+from ...utils import metrics
+
+r = APIRouter()
+
+
+@r.get('/',
+       response_model=dict[str, float],
+       dependencies=[Depends(get_current_user(active=True, superuser=True))],
+       responses={**auth_responses})
+async def read_metrics():
+    return metrics.snapshot()
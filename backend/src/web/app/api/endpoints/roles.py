@@ -1,14 +1,12 @@
-from typing import Any
+from fastapi import Depends, Request, Response
 
-from fastapi import Depends, Request
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from crud import Context
-from crud.openapi_responses import missing_token_or_inactive_user_response, not_found_response
+from crud import Context, make_etag, etag_matches, not_modified, not_modified_response
+from crud.openapi_responses import missing_token_or_inactive_user_response
 from ...dependencies.session import get_session
-from ...dependencies.user import get_current_user, Permission
+from ...dependencies.user import get_current_user
 from ...utils.crud import CrudAPIRouter
 from ...managers import RoleManager
+from ...conf import settings
 from storage.db.models import Role
 from ...schemas.roles import RoleCreate, RoleRead, RoleUpdate
 from fastapi import APIRouter
@@ -16,40 +14,28 @@ from fastapi import APIRouter
 role_manager = RoleManager()
 
 
-class Crud(CrudAPIRouter):
-    def _get_one(self, *args: Any, **kwargs: Any):
-
-        async def func(request: Request, id: int, session: AsyncSession = Depends(self.get_session)):
-            return await self.manager.get_or_404(session, id=id)
-
-        @self.get(
-            path='/{id}',
-            response_model=self.schema,
-            dependencies=[Depends(get_current_user())],
-            responses={**missing_token_or_inactive_user_response, **not_found_response}
-
-        )
-        async def route(role: Role = Permission('view', func)):
-            return role
-
-
-
-
-
 ctx = Context(manager=role_manager, get_session=get_session,
-        schema=RoleRead, create_schema=RoleCreate, update_schema=RoleUpdate
+        schema=RoleRead, create_schema=RoleCreate, update_schema=RoleUpdate,
+        export_route=True, bulk_create_route=True, bulk_update_route=True, fast_serialization=True,
+        cache_ttl=settings.RESPONSE_CACHE_TTL,
+        filter_fields=[Role.name], sort_fields=[Role.id, Role.name],
         )
 
-crud = Crud(ctx)
+crud = CrudAPIRouter(ctx)
 
 
 r = APIRouter()
 
 @r.get('/my', response_model=list[RoleRead], responses={
-    **missing_token_or_inactive_user_response
+    **missing_token_or_inactive_user_response, **not_modified_response
 })
-async def my_roles(user = Depends(get_current_user(active=True)),
+async def my_roles(request: Request, response: Response, user = Depends(get_current_user(active=True)),
                    session = Depends(get_session)):
+    # roles_version changes with the roles of the user and their names, no query for a 304
+    etag = make_etag(f'{user.id}-{user.roles_version}')
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
     return await role_manager.get_my_roles(session, user.id)
 
 
@@ -3,7 +3,7 @@ from typing import Any
 from fastapi_permissions import Allow
 from fastapi_users.authentication import Strategy
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, Request, UploadFile, HTTPException, status
+from fastapi import APIRouter, Depends, Request, Response, UploadFile, HTTPException, status
 
 from ...exceptions import FileDoesntSave
 from ...schemas.users import ReadUser, CreateUser, UpdateUser
@@ -16,8 +16,10 @@ from ...dependencies.session import get_session
 from storage.db.models import Role, File, User
 from crud.openapi_responses import missing_token_or_inactive_user_response, not_found_response, conflict_response
 from logging import getLogger
-from crud import Context
+from crud import Context, make_etag, etag_matches, not_modified, not_modified_response
 from ...utils.users import backend
+from ...authentication.strategy import revoke_sessions
+from crud.openapi_responses import auth_responses
 
 logger = getLogger(__name__)
 
@@ -42,15 +44,22 @@ class Crud(CrudAPIRouter):
 
 
 ctx = Context(manager=user_manager, get_session=get_session,
-              schema=ReadUser, create_schema=CreateUser, update_schema=UpdateUser
+              schema=ReadUser, create_schema=CreateUser, update_schema=UpdateUser,
+              export_route=True, bulk_create_route=True, bulk_update_route=True, fast_serialization=True,
+              filter_fields=[User.login, User.phone, User.is_active], sort_fields=[User.id, User.login],
               )
 crud = Crud(ctx)
 
 
 @r.get('/me',
        response_model=ReadUser,
-       responses={**missing_token_or_inactive_user_response})
-async def me(user=Depends(get_current_user(active=True))):
+       responses={**missing_token_or_inactive_user_response, **not_modified_response})
+async def me(request: Request, response: Response, user=Depends(get_current_user(active=True))):
+    # the user mostly comes from the snapshot cache, then a 304 runs no query at all
+    etag = make_etag(f'{user.id}-{user.version}')
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
     return user
 
 
@@ -90,4 +99,13 @@ async def files(upload_files: list[UploadFile], user=Depends(get_current_user(ac
     return result
 
 
+@r.delete('/{id}/sessions',
+          status_code=status.HTTP_204_NO_CONTENT,
+          responses={**auth_responses, **not_found_response},
+          dependencies=[Depends(get_current_user(active=True, superuser=True))]
+          )
+async def revoke_user_sessions(user=Depends(user_or_404)):
+    await revoke_sessions(user.id)
+
+
 r.include_router(crud)
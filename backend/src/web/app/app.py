@@ -1,13 +1,19 @@
+import asyncio
 import logging
 from fastapi import FastAPI, Request
 from .api.api import api
 from contextlib import asynccontextmanager
 from fastapi_pagination import add_pagination
+from .authentication.cache import listen_events
+from .authentication.strategy import seed_session_ids
 
 
 @asynccontextmanager
 async def lifespan(app):
+    await seed_session_ids()
+    listener = asyncio.create_task(listen_events())
     yield
+    listener.cancel()
 
 logging.basicConfig(level=logging.INFO)
 app = FastAPI(root_path='/api', lifespan=lifespan)
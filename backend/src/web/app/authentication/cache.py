@@ -0,0 +1,54 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Any
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from storage.cache.keys import REVOCATIONS, user_events_key
+from storage.cache.memory import LRUCache, ExpiringSet
+from storage.cache.redis_client import RedisClient, revocations_since
+from storage.db.models import User
+from ..conf import settings, connection_pool
+
+logger = getLogger(__name__)
+
+user_snapshots = LRUCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+# Sessions whose access tokens were revoked before they expire
+revoked_sessions = ExpiringSet()
+
+
+def make_snapshot(user: User) -> dict[str, Any]:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+async def user_from_snapshot(session: AsyncSession, snapshot: dict[str, Any]) -> User:
+    # Every request gets its own instance: it is attached to the request session
+    # as a clean persistent object, so no SQL is emitted and lazy loads still work
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return await session.merge(user, load=False)
+
+
+async def listen_events():
+    """Keeps the process caches in sync with user changes and session revocations"""
+    user_streams = [user_events_key(action) for action in ('create', 'update', 'delete')]
+    while True:
+        # Revocations made while the process was away still matter until their access tokens expire
+        start_ids = {REVOCATIONS: revocations_since(time.time() - settings.ACCESS_TOKEN_LIFETIME)}
+        try:
+            async with RedisClient(connection_pool=connection_pool) as redis:
+                async for name, payload in redis.listen(user_streams + [REVOCATIONS], start_ids):
+                    if name == REVOCATIONS:
+                        revoked_sessions.add(int(payload['sid']), float(payload['exp']))
+                    else:
+                        user_snapshots.pop(int(payload['user_id']))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # User events may have been missed while disconnected
+            logger.exception('Events listener failed', exc_info=e)
+            user_snapshots.clear()
+            await asyncio.sleep(1)
@@ -1,4 +1,8 @@
+from copy import deepcopy
 from datetime import datetime, date, timezone
+import hashlib
+import json
+import secrets
 import time
 from logging import getLogger
 from typing import Optional
@@ -8,14 +12,25 @@ from fastapi_users import models
 from fastapi_users.jwt import decode_jwt, generate_jwt, SecretType
 from fastapi_users.authentication.strategy import JWTStrategy as _JWTStrategy
 from redis.asyncio import Redis
+from sqlalchemy import delete, select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..dependencies.session import get_session
 from ..dependencies.redis import get_redis
 from contextlib import asynccontextmanager
 from storage.db.models import User, Session
+from storage.cache.keys import user_sessions_key, REVOKED_SESSIONS, \
+    REVOCATIONS
+from storage.cache.redis_client import RedisClient, revocations_since
+from storage.cache.memory import LRUCache
+from ..utils import metrics
+from ..conf import settings
+from .cache import user_snapshots, make_snapshot, user_from_snapshot, revoked_sessions
 
 logger = getLogger(__name__)
 
+# Verified payloads by token digest, strategies are created per request so the cache is module level
+decoded_tokens = LRUCache(settings.TOKEN_CACHE_SIZE)
+
 
 class JWTStrategy(_JWTStrategy):
 
@@ -32,38 +47,66 @@ class JWTStrategy(_JWTStrategy):
         self.lifetime_seconds = lifetime_seconds
         self.refresh_token_lifetime = refresh_token_lifetime
 
+    @metrics.redis_round_trips('auth.refresh.redis_round_trips')
     async def refresh_token(self, refresh_token: str):
+        metrics.incr('auth.refresh')
         payload = self._decode_token(refresh_token)
         if payload is None:
             return payload
 
+        jti, exp = self._new_refresh_claims()
         async with asynccontextmanager(get_redis)() as redis:
-            redis: Redis
-            refresh_token = await redis.get(f'session:{payload["sid"]}')
+            redis: RedisClient
+            rotated, principals = await redis.rotate_session(
+                payload['sid'], payload['sub'], self._session_value(payload['exp'], payload.get('jti', '')),
+                self._session_value(exp, jti), self._session_ttl,
+            )
+
+        if not rotated:
+            return None
+
+        principals = json.loads(principals) if principals is not None else {}
+        if 'roles' not in principals:
+            # Principals were invalidated by a change of the user, take them from the database once
+            principals = await self._load_principals(payload['sub'])
+            if principals is None:
+                return None
 
-        if refresh_token is None:
-            return refresh_token
+        payload.update(principals, jti=jti)
+        access_token, refresh_token = self.generate_pair_of_tokens(payload, exp)
+        return {'access_token': access_token, 'refresh_token': refresh_token, 'type': 'refresher'}
 
+    async def _load_principals(self, user_id: int) -> Optional[dict]:
         async with asynccontextmanager(get_session)() as session:
             session: AsyncSession
-            user = await session.get(User, payload['sub'])
+            user = await session.get(User, user_id)
             if user is None:
                 return user
-            principals = await user.principals()
+            principals = {'roles': await user.principals(), 'rv': user.roles_version}
 
-        payload['roles'] = principals
-        access_token, refresh_token = self.generate_pair_of_tokens(payload)
         async with asynccontextmanager(get_redis)() as redis:
-            redis: Redis
-            await redis.set(f'session:{payload["sid"]}', refresh_token)
+            redis: RedisClient
+            # not stored if the user changed since the read, the next refresh reads them again
+            await redis.store_principals(user_id, json.dumps(principals), self._session_ttl)
+        return principals
 
-        return {'access_token': access_token, 'refresh_token': refresh_token, 'type': 'refresher'}
+    @property
+    def _session_ttl(self) -> int:
+        return int(self.refresh_token_lifetime.total_seconds())
+
+    def _new_refresh_claims(self) -> tuple[str, int]:
+        return secrets.token_urlsafe(12), int(time.time()) + self._session_ttl
 
-    def generate_pair_of_tokens(self, payload: dict):
+    @staticmethod
+    def _session_value(exp: int, jti: str) -> str:
+        # The refresh exp leads the value, so expired sessions can be pruned in Redis
+        return f'{exp}:{jti}'
+
+    def generate_pair_of_tokens(self, payload: dict, refresh_exp: Optional[int] = None):
 
         payload['exp'] = datetime.now(timezone.utc) + self.lifetime_seconds
         access_token = jwt.encode(payload.copy(), self.encode_key, algorithm=self.algorithm)
-        payload['exp'] = datetime.now(timezone.utc) + self.refresh_token_lifetime
+        payload['exp'] = refresh_exp or datetime.now(timezone.utc) + self.refresh_token_lifetime
         refresh_token = jwt.encode(payload.copy(), self.encode_key, algorithm=self.algorithm)
         return access_token, refresh_token
 
@@ -75,11 +118,34 @@ class JWTStrategy(_JWTStrategy):
 
         res = self._decode_token(access_token)
 
-        if res is None:
-            return res
-        return await session.get(User, res['sub'])
+        if res is None or res['sid'] in revoked_sessions:
+            return None
+
+        snapshot = user_snapshots.get(res['sub'])
+        if snapshot is not None:
+            return await user_from_snapshot(session, snapshot)
+
+        user = await session.get(User, res['sub'])
+        if user is not None:
+            user_snapshots.set(user.id, make_snapshot(user))
+        return user
+
+    def read_principals(self, access_token: str, user: User) -> Optional[list[str]]:
+        """Principals from the token claims, None if the roles of the user changed since it was issued"""
+        res = self._decode_token(access_token)
+        if res is None or res.get('rv') != user.roles_version:
+            return None
+        return res['roles']
 
     def _decode_token(self, token: str):
+        key = hashlib.sha256(token.encode()).digest()
+        payload = decoded_tokens.get(key)
+        if payload is not None:
+            metrics.incr('auth.token_cache.hits')
+            # roles and aud are lists, callers get their own so the cached claims stay intact
+            return deepcopy(payload)
+        metrics.incr('auth.token_cache.misses')
+
         try:
             payload = decode_jwt(
                 token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
@@ -89,38 +155,98 @@ class JWTStrategy(_JWTStrategy):
 
         except (jwt.PyJWTError, ValueError, jwt.ExpiredSignatureError):
             return None
-        return payload
 
+        # A verified payload stays valid until the token expires
+        decoded_tokens.set(key, payload, ttl=payload['exp'] - time.time())
+        return deepcopy(payload)
+
+    @metrics.redis_round_trips('auth.logout.redis_round_trips')
     async def destroy_token(self, access_token: str, user: models.UP) -> None:
+        metrics.incr('auth.logout')
         res = self._decode_token(access_token)
         logger.info('res is %s', res)
         if res is None:
             return res
 
-        async with asynccontextmanager(get_session)() as session:
-            session: AsyncSession
-            user_session = await session.get(Session, res['sid'])
-            await session.delete(user_session)
-            await session.commit()
+        if settings.SESSION_STORE == 'database':
+            async with asynccontextmanager(get_session)() as session:
+                session: AsyncSession
+                await session.execute(delete(Session).where(Session.id == res['sid']))
+                await session.commit()
 
+        # a refresh may have issued an access token outliving the presented one, the revocation
+        # has to cover any token of the session
+        now = time.time()
+        exp = now + settings.ACCESS_TOKEN_LIFETIME
         async with asynccontextmanager(get_redis)() as redis:
             redis: Redis
-            await redis.delete(f'session:{user_session.id}')
-
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hdel(user_sessions_key(res['sub']), res['sid'])
+                if settings.SESSION_STORE == 'redis':
+                    pipe.rpush(REVOKED_SESSIONS, res['sid'])
+                pipe.xadd(REVOCATIONS, {'sid': res['sid'], 'exp': int(exp)},
+                          minid=revocations_since(now - settings.ACCESS_TOKEN_LIFETIME))
+                await pipe.execute()
+        revoked_sessions.add(res['sid'], exp)
+
+    @metrics.redis_round_trips('auth.login.redis_round_trips')
     async def write_token(self, user: User) -> dict:
-        async with asynccontextmanager(get_session)() as session:
-            session: AsyncSession
-            user_session = Session(user_id=user.id)
-            session.add(user_session)
-            principals = await user.principals()
-            await session.commit()
-
-        payload = {"sub": str(user.id), "aud": self.token_audience, 'sid': str(user_session.id), 'roles': principals}
-        access_token, refresh_token = self.generate_pair_of_tokens(payload)
+        metrics.incr('auth.login')
+        principals = {'roles': await user.principals(), 'rv': user.roles_version}
+        jti, exp = self._new_refresh_claims()
+
+        sid = None
+        if settings.SESSION_STORE == 'database':
+            async with asynccontextmanager(get_session)() as session:
+                session: AsyncSession
+                user_session = Session(user_id=user.id)
+                session.add(user_session)
+                await session.commit()
+                sid = user_session.id
 
-        logger.info('start execute redis ')
         async with asynccontextmanager(get_redis)() as redis:
-            redis: Redis
-            await redis.set(f'session:{user_session.id}', refresh_token)
+            redis: RedisClient
+            # only the exp and id of the current refresh token are kept, refresh compares and swaps them
+            sid = await redis.open_session(user.id, self._session_value(exp, jti), json.dumps(principals),
+                                           self._session_ttl, sid)
 
+        payload = {"sub": str(user.id), "aud": self.token_audience, 'sid': str(sid), 'jti': jti, **principals}
+        access_token, refresh_token = self.generate_pair_of_tokens(payload, exp)
         return {'access_token': access_token, 'refresh_token': refresh_token}
+
+
+async def seed_session_ids():
+    """Moves the Redis session id counter past the ids already in the sessions table"""
+    if settings.SESSION_STORE != 'redis':
+        return
+    async with asynccontextmanager(get_session)() as session:
+        session: AsyncSession
+        last_id = await session.scalar(select(func.max(Session.id)))
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: RedisClient
+        # a counter restored from an older snapshot would hand out ids of existing rows
+        await redis.seed_session_ids(last_id or 0)
+
+
+async def list_sessions(user_id: int) -> list[int]:
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: Redis
+        return sorted(int(sid) for sid in await redis.hkeys(user_sessions_key(user_id)))
+
+
+@metrics.redis_round_trips('auth.revoke_sessions.redis_round_trips')
+async def revoke_sessions(user_id: int) -> list[int]:
+    """Logs the user out everywhere: one Redis call for the sessions, one DELETE for the rows"""
+    metrics.incr('auth.revoke_sessions')
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: RedisClient
+        sids = await redis.revoke_sessions(user_id, write_behind=settings.SESSION_STORE == 'redis',
+                                           access_lifetime=settings.ACCESS_TOKEN_LIFETIME)
+    for sid in sids:
+        revoked_sessions.add(sid, time.time() + settings.ACCESS_TOKEN_LIFETIME)
+
+    async with asynccontextmanager(get_session)() as session:
+        session: AsyncSession
+        await session.execute(delete(Session).where(Session.user_id == user_id))
+        await session.commit()
+    return sids
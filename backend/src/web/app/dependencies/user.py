@@ -1,12 +1,12 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends
-from fastapi_permissions import Everyone, Authenticated, Allow, configure_permissions
-# from ..utils.permissions import configure_permissions
+from ..utils.permissions import Everyone, Authenticated, Allow, configure_permissions
 from ..utils.users import authenticator
 from .session import get_session
 from logging import getLogger
-from ..utils.users import authenticator, user_manager
+from ..utils.users import authenticator, user_manager, backend
+from ..authentication.strategy import JWTStrategy
+from ..conf import settings
 
 logger = getLogger(__name__)
 get_current_user = authenticator.current_user
@@ -16,9 +16,20 @@ async def user_or_404(id: int, session: AsyncSession = Depends(get_session)):
     return await user_manager.get_or_404(session, id=id)
 
 
-async def get_user_principals(user=Depends(authenticator.current_user(active=True))):
-    principals = await user.principals()
-    principals = principals + [Authenticated, Everyone]
+async def get_user_principals(user_token=Depends(authenticator.current_user_token(active=True)),
+                              strategy: JWTStrategy = Depends(backend.get_strategy)):
+    user, token = user_token
+    if settings.PRINCIPALS_FROM_TOKEN:
+        principals = strategy.read_principals(token, user)
+        if principals is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Roles changed, refresh the token',
+                headers={'WWW-Authenticate': 'refresher'},
+            )
+    else:
+        principals = await user.principals()
+    principals = frozenset([*principals, Authenticated, Everyone])
     logger.info('user principals %s', principals)
     return principals
 
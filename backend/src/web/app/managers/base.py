@@ -1,9 +1,123 @@
+from functools import cached_property
+from typing import Any, Iterable, Optional, Sequence
+
 from fastapi_sqlalchemy_toolkit import ModelManager
+from fastapi_sqlalchemy_toolkit.model_manager import ModelT
+from sqlalchemy import Row, column, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from logging import getLogger
 
+from ..utils.response_cache import invalidate_responses
 
 logger = getLogger("managers")
 
+# asyncpg takes at most 32767 bind parameters per statement
+MAX_BIND_PARAMS = 32767
+
 
 class BaseManager(ModelManager):
-    pass
\ No newline at end of file
+    # cached responses (by the tag of their router) which writes of the manager make stale
+    cache_tags: tuple[str, ...] = ()
+    # and those only deletes make stale, like responses reading rows the delete cascades to
+    delete_cache_tags: tuple[str, ...] = ()
+
+    async def invalidate_responses(self, tags: Optional[Iterable[str]] = None) -> None:
+        """Invalidates the tags, cache_tags by default. Only call it once the write is committed,
+        a response read before the commit could be cached again otherwise.
+        """
+        for tag in self.cache_tags if tags is None else tags:
+            await invalidate_responses(tag)
+
+    # with commit=False the caller commits, and invalidates after it
+
+    async def create(self, *args: Any, commit: bool = True, **kwargs: Any) -> ModelT:
+        obj = await super().create(*args, commit=commit, **kwargs)
+        if commit:
+            await self.invalidate_responses()
+        return obj
+
+    async def update(self, *args: Any, commit: bool = True, **kwargs: Any) -> ModelT:
+        obj = await super().update(*args, commit=commit, **kwargs)
+        if commit:
+            await self.invalidate_responses()
+        return obj
+
+    async def delete(self, *args: Any, commit: bool = True, **kwargs: Any) -> ModelT:
+        obj = await super().delete(*args, commit=commit, **kwargs)
+        if commit:
+            await self.invalidate_responses((*self.cache_tags, *self.delete_cache_tags))
+        return obj
+
+    @cached_property
+    def unique_columns(self) -> list[str]:
+        return [column.key for column in self.model.__table__.columns if column.unique]
+
+    @cached_property
+    def bulk_batch_size(self) -> int:
+        return max(1, min(1000, MAX_BIND_PARAMS // len(self.model.__table__.columns)))
+
+    async def bulk_insert(self, session: AsyncSession, rows: list[dict[str, Any]]) -> Sequence[ModelT]:
+        """One multi-row INSERT .. ON CONFLICT DO NOTHING, returns the inserted rows.
+
+        Runs in the transaction of the session, the caller commits.
+        """
+        rows = await self.prepare_bulk(session, rows)
+        stmt = insert(self.model).values(rows).on_conflict_do_nothing().returning(self.model)
+        objs = (await session.scalars(stmt)).all()
+        await self.after_bulk_insert(session, objs)
+        return objs
+
+    async def prepare_bulk(self, session: AsyncSession, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        return rows
+
+    async def after_bulk_insert(self, session: AsyncSession, objs: Sequence[ModelT]) -> None:
+        pass
+
+    async def bulk_created(self, objs: Sequence[ModelT]) -> None:
+        """Called once the bulk insert is committed"""
+        await self.invalidate_responses()
+
+    async def bulk_update(self, session: AsyncSession, changes: dict[int, dict[str, Any]]) -> Sequence[ModelT]:
+        """Applies changes by id with one UPDATE .. FROM (VALUES ..) per set of changed columns.
+
+        Runs in the transaction of the session, the caller commits. Returns the updated rows.
+        """
+        changes = await self.prepare_bulk_update(session, changes)
+        groups: dict[tuple[str, ...], list[tuple]] = {}
+        for id, data in changes.items():
+            keys = tuple(sorted(data))
+            groups.setdefault(keys, []).append((id, *(data[key] for key in keys)))
+
+        table = self.model.__table__
+        updated = []
+        for keys, rows in groups.items():
+            step = max(1, MAX_BIND_PARAMS // (len(keys) + 1))
+            for start in range(0, len(rows), step):
+                changed = values(column('id', table.c.id.type), *(column(key, table.c[key].type) for key in keys),
+                                 name='changes').data(rows[start:start + step])
+                stmt = (update(self.model).where(self.model.id == changed.c.id)
+                        .values({**{key: changed.c[key] for key in keys}, **self.bulk_update_extra(keys, changed)})
+                        .returning(self.model)
+                        .execution_options(synchronize_session=False, populate_existing=True))
+                updated.extend((await session.scalars(stmt)).all())
+        return updated
+
+    async def prepare_bulk_update(self, session: AsyncSession,
+                                  changes: dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
+        return changes
+
+    def bulk_update_extra(self, keys: tuple[str, ...], changed: Any) -> dict[str, Any]:
+        """Further SET values of a bulk update, computed from the changes table"""
+        return {}
+
+    async def bulk_updated(self, objs: Sequence[ModelT], changes: dict[int, dict[str, Any]]) -> None:
+        """Called once the bulk update is committed"""
+        await self.invalidate_responses()
+
+    # deletes of the whole table announce each row on the accounts.delete stream, for users
+    user_events = False
+
+    async def bulk_deleted(self, rows: Sequence[Row]) -> None:
+        """Called after each committed chunk of a delete of the whole table"""
+        await self.invalidate_responses((*self.cache_tags, *self.delete_cache_tags))
@@ -13,6 +13,8 @@ from fastapi import UploadFile
 
 
 class FilesManager(BaseManager):
+    cache_tags = ('files',)
+
     async def _save_file_to_static(self, file: UploadFile):
         url = f'{uuid4()}{file.filename}'
         filename = BASE_PATH / 'static' / url
@@ -43,6 +45,6 @@ class FilesManager(BaseManager):
             session.add(db_obj)
             # await self.save(session)
             await session.commit()
-
+        await self.invalidate_responses()
 
         return db_obj
@@ -1,21 +1,58 @@
-from typing import Callable, Any, List
+from typing import Callable, Any, List, Iterable
 
-from fastapi_sqlalchemy_toolkit.model_manager import ModelT
+from fastapi_sqlalchemy_toolkit.model_manager import ModelT, UpdateSchemaT
 from sqlalchemy import UnaryExpression, Row, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute
-from storage.db.models import UserRole, Role
+from storage.db.models import UserRole, Role, User
 from .base import BaseManager
+from .users import UsersManager
 from logging import getLogger
 
 
 
 class RoleManager(BaseManager):
+    cache_tags = ('roles',)
 
     def __init__(self,
                  default_ordering: InstrumentedAttribute | UnaryExpression | None = None,
                  ) -> None:
         super().__init__(Role, default_ordering)
+        self.users_manager = UsersManager()
+
+    async def update(
+            self,
+            session: AsyncSession,
+            db_obj: ModelT,
+            in_obj: UpdateSchemaT | None = None,
+            refresh_attribute_names: Iterable[str] | None = None,
+            *,
+            commit: bool = True,
+            exclude_unset: bool = True,
+            **attrs: Any,
+    ) -> ModelT:
+        name = db_obj.name
+        role = await super().update(session, db_obj, in_obj, refresh_attribute_names, commit=commit,
+                                    exclude_unset=exclude_unset, **attrs)
+        if role.name != name:
+            await self.users_manager.touch_roles(session, self.held_by(role.id))
+        return role
+
+    async def delete(self, session: AsyncSession, db_obj: ModelT, *, commit: bool = True) -> ModelT:
+        # Holders are gone together with user_roles rows, so touch them first
+        await self.users_manager.touch_roles(session, self.held_by(db_obj.id))
+        return await super().delete(session, db_obj, commit=commit)
+
+    async def bulk_update(self, session: AsyncSession, changes: dict[int, dict[str, Any]]) -> List[Role]:
+        roles = await super().bulk_update(session, changes)
+        renamed = [role.id for role in roles if 'name' in changes[role.id]]
+        if renamed:
+            await self.users_manager.touch_roles(session, self.held_by(*renamed))
+        return roles
+
+    @staticmethod
+    def held_by(*role_ids: int):
+        return User.id.in_(select(UserRole.user_id).where(UserRole.role_id.in_(role_ids)))
 
     async def get_my_roles(
             self,
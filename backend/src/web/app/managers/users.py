@@ -1,16 +1,28 @@
-from typing import Iterable, Any, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Iterable, Any, Optional, Literal, Sequence
 
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi_sqlalchemy_toolkit.model_manager import CreateSchemaT, ModelT
+from fastapi_sqlalchemy_toolkit.model_manager import CreateSchemaT, ModelT, UpdateSchemaT
 from fastapi_users.password import PasswordHelperProtocol, PasswordHelper
-from sqlalchemy import UnaryExpression, select
+from sqlalchemy import UnaryExpression, Row, select, update, insert, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute
-from storage.db.models import User, Role
+from storage.db.models import User, Role, UserRole
 from .base import BaseManager
+from ..authentication.cache import user_snapshots
+from ..dependencies.redis import get_redis
+from ..utils.passwords import hashing_executor
+from ..conf import settings
+from ..authentication.strategy import revoke_sessions
 
 
 class UsersManager(BaseManager):
+    # files of a deleted user lose their owner
+    delete_cache_tags = ('files',)
+    # cached responses a change of the column makes stale: files are viewable by their owner's login,
+    # superusers hold role:admin
+    column_cache_tags = {'login': 'files', 'is_superuser': 'roles'}
 
     def __init__(self,
                  default_ordering: InstrumentedAttribute | UnaryExpression | None = None,
@@ -31,26 +43,137 @@ class UsersManager(BaseManager):
             commit: bool = True,
             **attrs: Any,
     ) -> ModelT:
+        in_obj.password = await hashing_executor.run(self.password_helper.hash, in_obj.password)
         async with session.begin():
-            in_obj.password = self.password_helper.hash(in_obj.password)
             user = await super().create(session, in_obj, ['roles'], commit=False, **attrs)
             stmt = select(Role).where(Role.name == 'role:costumer')
             costumer_role = await session.scalar(stmt)
             user.roles = [costumer_role]
 
+        await self.broadcast(user, 'create')
         return user
 
+    async def prepare_bulk(self, session: AsyncSession, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # as many hashes at once as there are workers, a whole batch would overflow the hashing queue
+        step = settings.PASSWORD_HASHING_WORKERS
+        for start in range(0, len(rows), step):
+            group = rows[start:start + step]
+            hashes = await asyncio.gather(*(hashing_executor.run(self.password_helper.hash, row['password'])
+                                            for row in group))
+            for row, password in zip(group, hashes):
+                row['password'] = password
+        return rows
+
+    async def after_bulk_insert(self, session: AsyncSession, objs: Sequence[User]) -> None:
+        role_id = await session.scalar(select(Role.id).where(Role.name == 'role:costumer'))
+        if role_id is not None and objs:
+            await session.execute(insert(UserRole).values([{'user_id': user.id, 'role_id': role_id}
+                                                           for user in objs]))
+
+    async def bulk_created(self, objs: Sequence[User]) -> None:
+        await super().bulk_created(objs)
+        await self.broadcast_many(objs, 'create')
+
+    async def prepare_bulk_update(self, session: AsyncSession,
+                                  changes: dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
+        passwords = [data for data in changes.values() if data.get('password') is not None]
+        step = settings.PASSWORD_HASHING_WORKERS
+        for start in range(0, len(passwords), step):
+            group = passwords[start:start + step]
+            hashes = await asyncio.gather(*(hashing_executor.run(self.password_helper.hash, data['password'])
+                                            for data in group))
+            for data, password in zip(group, hashes):
+                data['password'] = password
+        return changes
+
+    def bulk_update_extra(self, keys: tuple[str, ...], changed: Any) -> dict[str, Any]:
+        # UpdateUser has no is_superuser, of the principals only the login changes in bulk
+        if 'login' not in keys:
+            return {}
+        # same as update, tokens issued before a change of the login are refreshed
+        return {'roles_version': User.roles_version + case((User.login != changed.c.login, 1), else_=0)}
+
+    async def bulk_updated(self, objs: Sequence[User], changes: dict[int, dict[str, Any]]) -> None:
+        await self.invalidate_responses({self.column_cache_tags[key] for data in changes.values()
+                                         for key in data if key in self.column_cache_tags})
+        await self.broadcast_many(objs, 'update')
+        for user in objs:
+            data = changes[user.id]
+            if data.get('password') is not None or data.get('is_active') is False:
+                await revoke_sessions(user.id)
+
+    user_events = True
+
+    async def bulk_deleted(self, rows: Sequence[Row]) -> None:
+        await super().bulk_deleted(rows)
+        await self.broadcast_many(rows, 'delete')
+
+    async def update(
+            self,
+            session: AsyncSession,
+            db_obj: ModelT,
+            in_obj: UpdateSchemaT | None = None,
+            refresh_attribute_names: Iterable[str] | None = None,
+            *,
+            commit: bool = True,
+            exclude_unset: bool = True,
+            **attrs: Any,
+    ) -> ModelT:
+        changes = in_obj.model_dump(exclude_unset=exclude_unset) if in_obj else {}
+        changes.update(attrs)
+        if changes.get('password') is not None:
+            attrs['password'] = await hashing_executor.run(self.password_helper.hash, changes['password'])
+        # the login is a principal as well, user:<login>
+        changed = [key for key in self.column_cache_tags if key in changes and changes[key] != getattr(db_obj, key)]
+        if changed:
+            attrs['roles_version'] = db_obj.roles_version + 1
+
+        user = await super().update(session, db_obj, in_obj, refresh_attribute_names, commit=commit,
+                                    exclude_unset=exclude_unset, **attrs)
+        if commit:
+            await self.invalidate_responses({self.column_cache_tags[key] for key in changed})
+        await self.broadcast(user, 'update')
+        if changes.get('password') is not None or changes.get('is_active') is False:
+            await revoke_sessions(user.id)
+        return user
+
+    async def delete(self, session: AsyncSession, db_obj: ModelT, *, commit: bool = True) -> ModelT:
+        user = await super().delete(session, db_obj, commit=commit)
+        await self.broadcast(user, 'delete')
+        return user
+
+    async def touch_roles(self, session: AsyncSession, where: Any) -> None:
+        """Bump roles_version of the matched users, so their tokens have to be refreshed"""
+        stmt = update(User).where(where).values(roles_version=User.roles_version + 1).returning(User)
+        users = (await session.scalars(stmt)).all()
+        await session.commit()
+        await self.invalidate_responses(['roles'])
+        for user in users:
+            await self.broadcast(user, 'update')
+
+    async def broadcast(self, user: User, action: Literal['create', 'update', 'delete']):
+        # Drop the local snapshot right away, other processes get it from the stream
+        user_snapshots.pop(user.id)
+        async with asynccontextmanager(get_redis)() as redis:
+            await redis.broadcast_user_cud_actions(user, action)
+
+    async def broadcast_many(self, users: Sequence[User], action: Literal['create', 'update', 'delete']):
+        for user in users:
+            user_snapshots.pop(user.id)
+        async with asynccontextmanager(get_redis)() as redis:
+            await redis.broadcast_users_cud_actions(users, action)
+
     async def authenticate(self, session: AsyncSession, credentials: OAuth2PasswordRequestForm):
         stmt = select(self.model).where(self.model.login == credentials.username)
         user = (await session.execute(stmt)).scalar()
         if not user:
             # Run the hasher to mitigate timing attack
             # Inspired from Django: https://code.djangoproject.com/ticket/20760
-            self.password_helper.hash(credentials.password)
+            await hashing_executor.run(self.password_helper.hash, credentials.password)
             return None
 
-        verified, updated_password_hash = self.password_helper.verify_and_update(
-            credentials.password, user.password
+        verified, updated_password_hash = await hashing_executor.run(
+            self.password_helper.verify_and_update, credentials.password, user.password
         )
         if not verified:
             return None
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Literal
 from pydantic import FieldValidationInfo, PostgresDsn, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -20,6 +20,29 @@ class Settings(BaseSettings):
     REDIS_HOST: str
     REDIS_PORT: int
     SQLALCHEMY_DATABASE_URL: str | None = None
+    # Token lifetimes in seconds
+    ACCESS_TOKEN_LIFETIME: int = 30 * 60
+    REFRESH_TOKEN_LIFETIME: int = 30 * 24 * 60 * 60
+    # In-process snapshots of authenticated users
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL: int = 60
+    # Verified JWT payloads, each kept until the token expires
+    TOKEN_CACHE_SIZE: int = 50_000
+    # Take principals from the verified `roles` claim instead of loading roles
+    PRINCIPALS_FROM_TOKEN: bool = True
+    # redis: sessions live in Redis and the worker writes the sessions table behind
+    SESSION_STORE: Literal['database', 'redis'] = 'redis'
+    # Password hashing pool, requests over the queue limit get 503
+    PASSWORD_HASHING_EXECUTOR: Literal['thread', 'process'] = 'thread'
+    PASSWORD_HASHING_WORKERS: int = 4
+    PASSWORD_HASHING_QUEUE: int = 64
+    # Seconds cached CRUD responses live at most, for the routers that opt in
+    RESPONSE_CACHE_TTL: int = 60
+    # estimated page totals under this many rows are counted exactly
+    EXACT_COUNT_BELOW: int = 10_000
+    # DELETE of whole tables: rows per committed chunk, bigger tables are emptied by the worker
+    DELETE_CHUNK_SIZE: int = 5000
+    DELETE_ALL_SYNC_LIMIT: int = 50_000
 
 
 
@@ -1,22 +1,167 @@
-from crud import CRUDTemplate
+from crud import CRUDTemplate, Keyset, Projection, Serializer, Filters, BulkCreateResult, BulkError, BulkUpdateResult, DeleteAllResult, \
+    read_rows, bulk_request_body, bulk_update_item, make_etag, etag_matches, not_modified, not_modified_response
 from ..dependencies.user import get_current_user, Permission, get_user_principals, AclBatchPermission
 from crud.openapi_responses import (
     missing_token_or_inactive_user_response, auth_responses, not_found_response, forbidden_response,
 )
-from fastapi_permissions import has_permission
-from typing import Any, TypeVar
-from fastapi import Depends, Request, status
+from .permissions import has_permissions, acl_filter, request_has_permission, permission_exception
+from .response_cache import response_cache_key, cached_response, cache_response, invalidate_responses
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from functools import cached_property
+from itertools import compress
+from logging import getLogger
+from typing import Any, TypeVar, Literal, Optional
+from fastapi import Depends, Request, Response, Query, HTTPException, status
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi_pagination.cursor import CursorPage, CursorParams
+from sqlalchemy import False_, True_, select, inspect
 from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.exc import IntegrityError
+from storage.db.models.base import RowPrincipal
+from storage.db.deletes import count_rows, delete_in_chunks, USER_EVENT_COLUMNS
+from storage.db.counts import exact_count, estimated_count
+from ..conf import settings, queue
+
+logger = getLogger(__name__)
 
 Resource = TypeVar('Resource')
 
+# rows fetched from the server side cursor at once
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def acl_columns(model) -> set[str]:
+    """Columns the acl of a model reads, they are loaded whatever fields are asked for"""
+    columns = {attr.key for attr in inspect(model).column_attrs}
+    sql_acl = getattr(model, '__sql_acl__', None)
+    if sql_acl is None:
+        return columns
+    keys = set()
+    for _, principal, _ in sql_acl():
+        if isinstance(principal, RowPrincipal):
+            key = getattr(principal.match, 'key', None)
+            if key not in columns:
+                # a join, __acl__ may read anything
+                return columns
+            keys.add(key)
+    return keys
+
 
 class CrudAPIRouter(CRUDTemplate):
 
-    def _get_all(self, *args: Any, **kwargs: Any):
+    @cached_property
+    def projection(self) -> Projection:
+        model = self.manager.model
+        required = acl_columns(model) | {self.ctx.get('cursor_column', model.id).key}
+        if self.versioned:
+            required.add('version')
+        return Projection(model, self.schema, required)
+
+    @cached_property
+    def versioned(self) -> bool:
+        return 'version' in inspect(self.manager.model).column_attrs
+
+    @cached_property
+    def cache_ttl(self) -> int:
+        return self.ctx.get('cache_ttl', 0)
+
+    @cached_property
+    def cache_tag(self) -> str:
+        return self.manager.model.__tablename__
+
+    @cached_property
+    def serializer(self) -> Serializer:
+        return Serializer(self.schema)
+
+    @cached_property
+    def fast_serialization(self) -> bool:
+        return self.ctx.get('fast_serialization', False)
+
+    def dump(self, resource, fields: Optional[list[str]]) -> bytes:
+        if fields is None:
+            return self.serializer.dump(resource)
+        return json.dumps(self.projection.render(resource, fields)).encode()
+
+    def dump_many(self, resources, fields: Optional[list[str]]) -> bytes:
+        if fields is None:
+            return self.serializer.dump_many(resources)
+        return json.dumps([self.projection.render(resource, fields) for resource in resources]).encode()
+
+    @cached_property
+    def stale_tags(self) -> list[str]:
+        """Cached responses a delete of the whole table makes stale"""
+        tags = [*self.manager.cache_tags, *self.manager.delete_cache_tags]
+        if self.cache_ttl and self.cache_tag not in tags:
+            tags.append(self.cache_tag)
+        return tags
+
+    async def invalidate_cache(self):
+        # the manager invalidates its tags on its own
+        if self.cache_ttl and self.cache_tag not in self.manager.cache_tags:
+            await invalidate_responses(self.cache_tag)
+
+    @cached_property
+    def requested_fields(self):
+        # one dependency per router, so FastAPI parses fields= once per request
+        async def dependency(fields: Optional[str] = Query(
+                None, description='Comma separated fields to return, all fields of the schema by default')):
+            return self.projection.parse(fields)
+
+        return dependency
+
+    @cached_property
+    def filters(self) -> Filters:
+        filters = Filters(self.manager.model, self.ctx.get('filter_fields', ()), self.ctx.get('sort_fields', ()))
+        for key in filters.unindexed():
+            logger.warning('%s is filtered or sorted by %s, no index starts with it',
+                           self.manager.model.__tablename__, key)
+        return filters
+
+    @cached_property
+    def filter_params(self):
+        return self.filters.dependency()
+
+    @cached_property
+    def page_filters(self) -> Filters:
+        # keyset pages are ordered by the cursor column, no sort
+        return Filters(self.manager.model, self.ctx.get('filter_fields', ()), ())
 
-        async def func(request: Request, session: AsyncSession = Depends(self.get_session), ):
-            return await self.manager.list(session)
+    @cached_property
+    def page_filter_params(self):
+        return self.page_filters.dependency()
+
+    async def count(self, session: AsyncSession, stmt) -> Optional[int]:
+        strategy = self.ctx.get('count_strategy', 'none')
+        if strategy == 'exact':
+            return await exact_count(session, stmt)
+        if strategy == 'estimated':
+            return await estimated_count(session, stmt, self.manager.model.__tablename__,
+                                         settings.EXACT_COUNT_BELOW)
+        return None
+
+    def render(self, resources, fields: Optional[list[str]]):
+        if fields is None:
+            return resources
+        return JSONResponse([self.projection.render(resource, fields) for resource in resources])
+
+    def _get_all(self, *args: Any, **kwargs: Any):
+        async def func(session: AsyncSession, principals: frozenset, fields: Optional[list[str]], params):
+            options = self.projection.options(fields)
+            filters = dict(order_by=self.filters.order_by(params), filter_expressions=self.filters.expressions(params))
+            where = acl_filter(self.manager.model, principals, 'view')
+            if where is None:
+                resources = await self.manager.list(session, options=options, **filters)
+                return list(compress(resources, await has_permissions(principals, 'view', resources)))
+            if isinstance(where, False_):
+                return []
+            # only the permitted rows leave postgres
+            return await self.manager.list(session, where=None if isinstance(where, True_) else where,
+                                           options=options, **filters)
 
         @self.get(
             path='/',
@@ -26,27 +171,199 @@ class CrudAPIRouter(CRUDTemplate):
 
         )
         async def filter_operation(
-                resources: list[Resource] = Depends(func),
-                principals: list = Depends(get_user_principals),
+                request: Request,
+                session: AsyncSession = Depends(self.get_session),
+                principals: frozenset = Depends(get_user_principals),
+                fields: Optional[list[str]] = Depends(self.requested_fields),
+                params=Depends(self.filter_params),
                 # acls: list = Permission("batch", AclBatchPermission)
         ):
-            return [item for item in resources if has_permission(principals, "view", item)]
+            if self.cache_ttl:
+                key = response_cache_key(self.cache_tag, principals, request)
+                cached, generation = await cached_response(self.cache_tag, key, request)
+                if cached is not None:
+                    return cached
+
+            resources = await func(session, principals, fields, params)
+            if self.cache_ttl:
+                return await cache_response(self.cache_tag, key, generation, self.dump_many(resources, fields),
+                                            self.cache_ttl)
+            if self.fast_serialization:
+                return Response(self.dump_many(resources, fields), media_type='application/json')
+            return self.render(resources, fields)
+
+    def _get_page(self, *args: Any, **kwargs: Any):
+        model = self.manager.model
+        keyset = Keyset(self.ctx.get('cursor_column', model.id), model.id)
+        page_adapter = TypeAdapter(CursorPage[self.schema])
+
+        @self.get(
+            path='/page',
+            response_model=CursorPage[self.schema],
+            dependencies=[Depends(get_current_user())],
+            responses={**missing_token_or_inactive_user_response, **forbidden_response}
+        )
+        async def route(request: Request, params: CursorParams = Depends(),
+                        session: AsyncSession = Depends(self.get_session),
+                        principals: frozenset = Depends(get_user_principals),
+                        fields: Optional[list[str]] = Depends(self.requested_fields),
+                        filters=Depends(self.page_filter_params)):
+            if self.cache_ttl:
+                key = response_cache_key(self.cache_tag, principals, request)
+                cached, generation = await cached_response(self.cache_tag, key, request)
+                if cached is not None:
+                    return cached
+
+            raw_params = params.to_raw_params()
+            where = acl_filter(model, principals, 'view')
+            if isinstance(where, False_):
+                return CursorPage.create([], params)
+
+            matching = select(model).where(*self.page_filters.conditions(filters))
+            if where is not None and not isinstance(where, True_):
+                matching = matching.where(where)
+            stmt = keyset.apply(matching.options(*self.projection.options(fields)), raw_params.cursor, raw_params.size)
+            rows = (await session.scalars(stmt)).all()
+            page = rows[:raw_params.size]
+            next_page = keyset.encode(page[-1]) if len(rows) > raw_params.size and page else None
+
+            if where is None:
+                # filtered after the limit, pages can come out shorter but no row is skipped
+                page = list(compress(page, await has_permissions(principals, 'view', page)))
+            if fields is not None:
+                page = [self.projection.render(item, fields) for item in page]
+            # rows the acl drops in python are not counted in SQL, no total then
+            total = await self.count(session, matching) if where is not None else None
+            result = CursorPage.create(page, params, current=raw_params.cursor, next_=next_page, total=total)
+
+            if self.cache_ttl or self.fast_serialization:
+                if fields is None:
+                    body = page_adapter.dump_json(page_adapter.validate_python(result, from_attributes=True))
+                else:
+                    body = result.model_dump_json()
+                if self.cache_ttl:
+                    return await cache_response(self.cache_tag, key, generation, body, self.cache_ttl)
+                return Response(body, media_type='application/json')
+            if fields is not None:
+                return JSONResponse(result.model_dump(mode='json'))
+            return result
+
+    def _export(self, *args: Any, **kwargs: Any):
+        model = self.manager.model
+        adapter = self.serializer.one
+
+        async def chunks(where, principals: frozenset, fields: Optional[list[str]], params):
+            # the request session is closed before a streaming body is sent, the export opens its own
+            if isinstance(where, False_):
+                return
+            async with asynccontextmanager(self.get_session)() as session:
+                sort = self.filters.order_by(params)
+                stmt = (select(model).options(*self.projection.options(fields))
+                        .where(*self.filters.conditions(params))
+                        .order_by(*([sort] if sort is not None else []), model.id)
+                        .execution_options(yield_per=EXPORT_CHUNK_SIZE))
+                if where is not None and not isinstance(where, True_):
+                    stmt = stmt.where(where)
+                result = await session.stream_scalars(stmt)
+                async for chunk in result.partitions():
+                    if where is None:
+                        chunk = list(compress(chunk, await has_permissions(principals, 'view', chunk)))
+                    yield chunk
+
+        def as_dicts(chunk, fields: Optional[list[str]]) -> list[dict]:
+            if fields is None:
+                return [adapter.dump_python(adapter.validate_python(row, from_attributes=True), mode='json')
+                        for row in chunk]
+            return [self.projection.render(row, fields) for row in chunk]
+
+        async def ndjson(where, principals: frozenset, fields: Optional[list[str]], params):
+            async for chunk in chunks(where, principals, fields, params):
+                if fields is None:
+                    yield b''.join(self.serializer.dump(row) + b'\n' for row in chunk)
+                else:
+                    yield ''.join(json.dumps(item) + '\n' for item in as_dicts(chunk, fields))
+
+        async def csv_rows(where, principals: frozenset, fields: Optional[list[str]], params):
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fields or self.projection.fields, extrasaction='ignore')
+            writer.writeheader()
+            async for chunk in chunks(where, principals, fields, params):
+                writer.writerows(as_dicts(chunk, fields))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+        @self.get(
+            '/export',
+            response_class=StreamingResponse,
+            dependencies=[Depends(get_current_user())],
+            responses={
+                200: {'content': {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}},
+                **missing_token_or_inactive_user_response, **forbidden_response,
+            }
+        )
+        async def route(format: Literal['ndjson', 'csv'] = 'ndjson',
+                        principals: frozenset = Depends(get_user_principals),
+                        fields: Optional[list[str]] = Depends(self.requested_fields),
+                        params=Depends(self.filter_params)):
+            where = acl_filter(model, principals, 'view')
+            body = (ndjson if format == 'ndjson' else csv_rows)(where, principals, fields, params)
+            return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format])
 
     def _get_one(self, *args: Any, **kwargs: Any):
-        async def func(request: Request, id: int, session: AsyncSession = Depends(self.get_session)):
-            return await self.manager.get_or_404(session, id=id)
+        async def func(request: Request, id: int, session: AsyncSession, fields: Optional[list[str]]):
+            if self.versioned and 'if-none-match' in request.headers:
+                # the acl columns and the version are enough for a 304, the rest is loaded if it changed
+                options = self.projection.load(self.projection.required)
+            else:
+                options = self.projection.options(fields)
+            return await self.manager.get_or_404(session, options=options, id=id)
 
         @self.get(
             path='/{id}',
             response_model=self.schema,
             dependencies=[Depends(get_current_user())],
             responses={**missing_token_or_inactive_user_response, **not_found_response,
-                       **forbidden_response,
+                       **forbidden_response, **not_modified_response,
                        }
 
         )
-        async def route(resource=Permission('view', func)):
-            return resource
+        async def route(request: Request, response: Response, id: int,
+                        principals: frozenset = Depends(get_user_principals),
+                        fields: Optional[list[str]] = Depends(self.requested_fields),
+                        session: AsyncSession = Depends(self.get_session)):
+            # the permission is checked here, a cached response skips the database altogether
+            if self.cache_ttl:
+                key = response_cache_key(self.cache_tag, principals, request)
+                cached, generation = await cached_response(self.cache_tag, key, request)
+                if cached is not None:
+                    return cached
+
+            resource = await func(request, id, session, fields)
+            if not await request_has_permission(request, principals, 'view', resource):
+                raise permission_exception
+
+            headers = {}
+            etag = None
+            if self.versioned:
+                etag = make_etag(resource.version, fields)
+                if etag_matches(request, etag):
+                    return not_modified(etag)
+                unloaded = self.projection.keys(fields) & inspect(resource).unloaded
+                if unloaded:
+                    await session.refresh(resource, list(unloaded))
+                headers['ETag'] = etag
+
+            if self.cache_ttl:
+                return await cache_response(self.cache_tag, key, generation, self.dump(resource, fields),
+                                            self.cache_ttl, etag)
+            if self.fast_serialization:
+                return Response(self.dump(resource, fields), media_type='application/json', headers=headers)
+            if fields is None:
+                response.headers.update(headers)
+                return resource
+            return JSONResponse(self.projection.render(resource, fields), headers=headers)
 
     def _create(self, *args: Any, **kwargs: Any):
         create_schema = self.create_schema
@@ -61,8 +378,116 @@ class CrudAPIRouter(CRUDTemplate):
             responses={**missing_token_or_inactive_user_response, **forbidden_response}
         )
         async def route(resource=Permission('create', func)):
+            await self.invalidate_cache()
             return resource
 
+    def _bulk_create(self, *args: Any, **kwargs: Any):
+        create_schema = self.create_schema
+        unique = self.manager.unique_columns
+
+        @self.post(
+            '/bulk',
+            response_model=BulkCreateResult,
+            responses={**auth_responses, **forbidden_response},
+            openapi_extra=bulk_request_body(create_schema),
+        )
+        async def route(request: Request, session: AsyncSession = Depends(self.get_session),
+                        user=Depends(get_current_user(superuser=True))):
+            result = BulkCreateResult()
+            seen = {column: set() for column in unique}
+            batch: list[tuple[int, dict]] = []
+            created = []
+
+            async def flush():
+                objs = await self.manager.bulk_insert(session, [data for _, data in batch])
+                created.extend(objs)
+                if unique:
+                    # rows missing from RETURNING hit a unique value already in the table
+                    inserted = {getattr(obj, unique[0]) for obj in objs}
+                    result.errors.extend(BulkError(row=row, detail='Conflicts with an existing row')
+                                         for row, data in batch if data[unique[0]] not in inserted)
+                batch.clear()
+
+            try:
+                async for row, item, error in read_rows(request):
+                    if error is not None:
+                        result.errors.append(BulkError(row=row, detail=error))
+                        continue
+                    try:
+                        data = create_schema.model_validate(item).model_dump()
+                    except ValidationError as e:
+                        result.errors.append(
+                            BulkError(row=row, detail=e.errors(include_url=False, include_context=False)))
+                        continue
+
+                    duplicated = [column for column in unique if data.get(column) in seen[column]]
+                    if duplicated:
+                        result.errors.append(
+                            BulkError(row=row, detail=f'Duplicated {", ".join(duplicated)} in request'))
+                        continue
+                    for column in unique:
+                        seen[column].add(data.get(column))
+
+                    batch.append((row, data))
+                    if len(batch) >= self.manager.bulk_batch_size:
+                        await flush()
+                if batch:
+                    await flush()
+                # all or nothing for the valid rows
+                await session.commit()
+            except IntegrityError as e:
+                await session.rollback()
+                raise HTTPException(status.HTTP_409_CONFLICT, str(e.orig)) from None
+
+            await self.invalidate_cache()
+            await self.manager.bulk_created(created)
+            result.created = len(created)
+            result.ids = [obj.id for obj in created]
+            result.errors.sort(key=lambda error: error.row)
+            return result
+
+    def _bulk_update(self, *args: Any, **kwargs: Any):
+        item_schema = bulk_update_item(self.update_schema)
+        model = self.manager.model
+
+        @self.patch(
+            '/bulk',
+            response_model=BulkUpdateResult,
+            responses={**auth_responses, **forbidden_response},
+        )
+        async def route(items: list[item_schema], session: AsyncSession = Depends(self.get_session),
+                        user=Depends(get_current_user(superuser=True)),
+                        principals: frozenset = Depends(get_user_principals)):
+            changes = {}
+            for item in items:
+                if item.id in changes:
+                    raise HTTPException(status.HTTP_400_BAD_REQUEST, f'Duplicated id {item.id}')
+                changes[item.id] = item.changes.model_dump(exclude_unset=True)
+
+            found = (await session.scalars(select(model).where(model.id.in_(changes)))).all()
+            found_ids = {obj.id for obj in found}
+            allowed = await has_permissions(principals, 'edit', found)
+            result = BulkUpdateResult(
+                missing=[id for id in changes if id not in found_ids],
+                forbidden=sorted(obj.id for obj, ok in zip(found, allowed) if not ok),
+            )
+            # ids without changes are left alone
+            changes = {obj.id: changes[obj.id] for obj in compress(found, allowed) if changes[obj.id]}
+            if not changes:
+                return result
+
+            try:
+                updated = await self.manager.bulk_update(session, changes)
+                await session.commit()
+            except IntegrityError as e:
+                await session.rollback()
+                raise HTTPException(status.HTTP_409_CONFLICT, str(e.orig)) from None
+
+            await self.invalidate_cache()
+            await self.manager.bulk_updated(updated, changes)
+            result.updated = sorted(obj.id for obj in updated)
+            return result
+
     def _update(self, *args: Any, **kwargs: Any):
         update_schema = self.update_schema
 
@@ -79,24 +504,59 @@ class CrudAPIRouter(CRUDTemplate):
                        }
         )
         async def route(resource=Permission('edit', func)):
+            await self.invalidate_cache()
             return resource
 
     def _delete_all(self, *args: Any, **kwargs: Any):
 
+        model = self.manager.model
+        table_name = model.__tablename__
+        job_key = f'delete_all:{table_name}'
+
         @self.delete(
             '/',
-            status_code=status.HTTP_204_NO_CONTENT,
-            responses={**auth_responses, **forbidden_response}
+            response_model=DeleteAllResult,
+            responses={**auth_responses, **forbidden_response,
+                       202: {'model': DeleteAllResult, 'description': 'Queued to the worker'}}
         )
-        async def route(resource=Permission('delete_all', get_current_user(superuser=True)),
+        async def route(response: Response,
+                        resource=Permission('delete_all', get_current_user(superuser=True)),
                         session: AsyncSession = Depends(self.get_session)):
+            # the caller stays when deleting users
+            exclude_id = resource.id if isinstance(resource, model) else None
 
-            for model in await self.manager.list(session):
-                if model.id == resource.id:
-                    continue
-                await session.delete(model)
-            await session.commit()
-            return
+            if await count_rows(session, table_name, settings.DELETE_ALL_SYNC_LIMIT) > settings.DELETE_ALL_SYNC_LIMIT:
+                await queue.enqueue('delete_all', key=job_key, timeout=0, ttl=24 * 60 * 60,
+                                    table=table_name, chunk_size=settings.DELETE_CHUNK_SIZE,
+                                    exclude_id=exclude_id, user_events=self.manager.user_events,
+                                    cache_tags=self.stale_tags)
+                response.status_code = status.HTTP_202_ACCEPTED
+                # a delete already running keeps its job, enqueue is a no-op then
+                return await delete_job_result()
+
+            async def on_chunk(rows, deleted):
+                await self.manager.bulk_deleted(rows)
+
+            deleted = await delete_in_chunks(session, table_name, settings.DELETE_CHUNK_SIZE, exclude_id,
+                                             USER_EVENT_COLUMNS if self.manager.user_events else (), on_chunk)
+            await self.invalidate_cache()
+            return DeleteAllResult(status='complete', deleted=deleted, progress=1.0)
+
+        async def delete_job_result() -> DeleteAllResult:
+            job = await queue.job(job_key)
+            if job is None:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, 'No delete in progress')
+            return DeleteAllResult(status=job.status, deleted=job.meta.get('deleted', 0), progress=job.progress,
+                                   job=job.key)
+
+        @self.get(
+            '/delete_all/status',
+            response_model=DeleteAllResult,
+            dependencies=[Depends(get_current_user(superuser=True))],
+            responses={**auth_responses, **not_found_response}
+        )
+        async def progress():
+            return await delete_job_result()
 
     def _delete_one(self, *args: Any, **kwargs: Any):
 
@@ -109,4 +569,5 @@ class CrudAPIRouter(CRUDTemplate):
                         resource=Permission('delete', get_current_user(superuser=True))):
             obj_in_db = await self.manager.get_or_404(session, id=id)
             await self.manager.delete(session, obj_in_db)
+            await self.invalidate_cache()
             return
@@ -0,0 +1,34 @@
+from collections import Counter
+from functools import wraps
+
+from storage.cache.redis_client import count_round_trips
+
+# Process local counters and gauges, exposed through GET /metrics
+counters: Counter[str] = Counter()
+gauges: dict[str, float] = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    counters[name] += value
+
+
+def gauge(name: str, value: float) -> None:
+    gauges[name] = value
+
+
+def redis_round_trips(name: str):
+    """Adds the Redis round trips of every call of the coroutine function to the counter"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with count_round_trips() as trips:
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    incr(name, trips.count)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict[str, float]:
+    return {**counters, **gauges}
@@ -0,0 +1,43 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from ..conf import settings
+from . import metrics
+
+
+class HashingExecutor:
+    """Runs password hashing off the event loop with a bounded number of queued jobs"""
+
+    def __init__(self, executor: Executor, max_queue: int):
+        self.executor = executor
+        self.max_queue = max_queue
+        self.queued = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.queued >= self.max_queue:
+            metrics.incr('passwords.rejected')
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many password checks in progress, try again later',
+            )
+
+        self.queued += 1
+        metrics.gauge('passwords.queue_depth', self.queued)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.queued -= 1
+            metrics.gauge('passwords.queue_depth', self.queued)
+
+
+def make_executor() -> Executor:
+    if settings.PASSWORD_HASHING_EXECUTOR == 'process':
+        return ProcessPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS)
+    # argon2 and bcrypt release the GIL while hashing, so threads are enough by default
+    return ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='passwords')
+
+
+hashing_executor = HashingExecutor(make_executor(), settings.PASSWORD_HASHING_QUEUE)
@@ -51,12 +51,14 @@ extremely simple and incomplete example:
 __version__ = "0.2.7"
 
 import functools
-import itertools
-from typing import Any
-from inspect import iscoroutinefunction
-from fastapi import Depends, HTTPException
+from typing import Any, Iterable
+from inspect import iscoroutine
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import False_, True_, and_, false, not_, or_, true
 from starlette.status import HTTP_403_FORBIDDEN
 
+from . import metrics
+
 # constants
 
 Allow = "Allow"  # acl "allow" action
@@ -97,6 +99,7 @@ permission_exception = HTTPException(
 
 
 def configure_permissions(
+        active_principals_func: Any,
         permission_exception: HTTPException = permission_exception,
 ):
     """ sets the basic configuration for the permissions system
@@ -112,6 +115,7 @@ def configure_permissions(
 
     return functools.partial(
         permission_dependency_factory,
+        active_principals_func,
         permission_exception=permission_exception,
     )
 
@@ -148,17 +152,76 @@ def permission_dependency_factory(
     # user dependable in the definition
     # the permission itself is available through the outer function scope
     async def wrapper(
-            resource=dependable_resource, principals=Depends(principals_func)
+            request: Request, resource=dependable_resource, principals=Depends(principals_func)
     ):
-        if await has_permission(principals, permission, resource):
+        if await request_has_permission(request, principals, permission, resource):
             return resource
         raise permission_exception
 
     return Depends(wrapper)
 
 
+async def request_has_permission(
+        request: Request, user_principals: Iterable[str], requested_permission: str, resource: Any
+):
+    """ has_permission memoized for the duration of a request
+
+    Decisions are kept on request.state by (principals, permission, resource)
+    and shared by every permission dependency of the request.
+    """
+    decisions = getattr(request.state, "permission_decisions", None)
+    if decisions is None:
+        decisions = request.state.permission_decisions = {}
+
+    principals = as_principals(user_principals)
+    key = (principals, requested_permission, resource_identity(resource))
+    decision = decisions.get(key)
+    if decision is not None:
+        metrics.incr("permissions.decisions.saved")
+        return decision
+
+    metrics.incr("permissions.decisions.evaluated")
+    decision = decisions[key] = await has_permission(principals, requested_permission, resource)
+    return decision
+
+
+def resource_identity(resource: Any):
+    """ hashable identity of a resource within a request
+
+    Rows are taken by type and primary key, plus their "__acl_key__" so a row
+    changed by the request is checked again. Anything else by itself, or by
+    the object identity if it isn't hashable, the decision cache keeps it
+    alive until the request ends.
+    """
+    ident = getattr(resource, "id", None)
+    if ident is not None:
+        return type(resource), ident, resource_key(resource)
+    if not hasattr(resource, "__acl__") and is_like_list(resource):
+        return acl_key(resource)
+    try:
+        hash(resource)
+    except TypeError:
+        return ObjectIdentity(resource)
+    return resource
+
+
+class ObjectIdentity:
+    """ dict key of an unhashable object, equal only to keys of the same object """
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectIdentity) and other.obj is self.obj
+
+
 async def has_permission(
-        user_principals: list, requested_permission: str, resource: Any
+        user_principals: Iterable[str], requested_permission: str, resource: Any
 ):
     """ checks if a user has the permission for a resource
 
@@ -170,18 +233,11 @@ async def has_permission(
 
     returns bool: permission granted or denied
     """
-    acl = await normalize_acl(resource)
-
-    for action, principal, permissions in acl:
-        if isinstance(permissions, str):
-            permissions = {permissions}
-        if requested_permission in permissions:
-            if principal in user_principals:
-                return action == Allow
-    return False
+    compiled = await compiled_acl_of(resource)
+    return compiled.allows(as_principals(user_principals), requested_permission)
 
 
-async def list_permissions(user_principals: list, resource: Any):
+async def list_permissions(user_principals: Iterable[str], resource: Any):
     """ lists all permissions of a user for a resouce
 
     user_principals: the principals of a user
@@ -190,17 +246,261 @@ async def list_permissions(user_principals: list, resource: Any):
     returns dict: every available permission of the resource as key
                   and True / False as value if the permission is granted.
     """
-    acl = await normalize_acl(resource)
-
-    acl_permissions = (permissions for _, _, permissions in acl)
-    as_iterables = ({p} if not is_like_list(p) else p for p in acl_permissions)
-    permissions = set(itertools.chain.from_iterable(as_iterables))
+    compiled = await compiled_acl_of(resource)
+    principals = as_principals(user_principals)
 
     return {
-        str(p): has_permission(user_principals, p, acl) for p in permissions
+        str(p): compiled.allows(principals, p) for p in compiled.permissions
     }
 
 
+# compiled acls
+
+
+class CompiledACL:
+    """ an acl turned into hash lookups
+
+    For every permission named in the acl the rules that apply to it are
+    folded into a dict principal -> (position, action), keeping only the first
+    rule for a principal, like the linear scan would. Rules granting All end up
+    in every dict and in the fallback used for permissions the acl never names.
+    Without Deny rules a check is a single isdisjoint(), otherwise the matching
+    rule with the lowest position wins.
+    """
+
+    __slots__ = ("index", "fallback", "permissions")
+
+    def __init__(self, acl):
+        named = {}
+        wildcard = []
+        for position, (action, principal, permissions) in enumerate(acl):
+            if isinstance(permissions, str):
+                permissions = (permissions,)
+            elif not is_like_list(permissions):
+                # All and other containers match any permission
+                wildcard.append(position)
+                permissions = (permissions,)
+            for permission in permissions:
+                named.setdefault(permission, []).append(position)
+
+        self.permissions = tuple(named)
+        self.fallback = self._fold(acl, wildcard)
+        self.index = {
+            permission: self._fold(acl, sorted(set(positions) | set(wildcard)))
+            for permission, positions in named.items()
+            if isinstance(permission, str)
+        }
+
+    @staticmethod
+    def _fold(acl, positions):
+        rules = {}
+        for position in positions:
+            action, principal, _ = acl[position]
+            rules.setdefault(principal, (position, action))
+        only_allow = all(action == Allow for _, action in rules.values())
+        return rules, only_allow
+
+    def allows(self, principals: frozenset, permission: str) -> bool:
+        rules, only_allow = self.index.get(permission, self.fallback)
+        if only_allow:
+            return not rules.keys().isdisjoint(principals)
+
+        best = None
+        for principal in principals:
+            rule = rules.get(principal)
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        return best is not None and best[1] == Allow
+
+
+# compiled acls by model class and the values the acl is parameterized with,
+# or by the acl itself for resources without __acl_key__
+compiled_acls: dict[tuple, CompiledACL] = {}
+COMPILED_ACLS_SIZE = 10_000
+
+
+async def compiled_acl_of(resource: Any) -> CompiledACL:
+    """ returns the compiled acl of a resource
+
+    A resource can define "__acl_key__()" returning the attributes its acl
+    depends on, then a cached acl is found without building the acl at all.
+    """
+    key = resource_key(resource)
+    compiled = compiled_acls.get(key) if key is not None else None
+    if compiled is None:
+        acl = acl_of(resource)
+        if iscoroutine(acl):
+            acl = await acl
+        compiled = compile_acl(acl, key)
+    return compiled
+
+
+def resource_key(resource: Any):
+    key_func = getattr(resource, "__acl_key__", None)
+    if key_func is None:
+        return None
+    return type(resource), key_func()
+
+
+def compile_acl(acl, key=None) -> CompiledACL:
+    """ returns the cached compiled form of an acl, compiling it if needed """
+    if key is None:
+        try:
+            key = tuple(acl)
+            hash(key)
+        except TypeError:
+            # permission lists are not hashable
+            key = acl_key(acl)
+    compiled = compiled_acls.get(key)
+    if compiled is None:
+        if len(compiled_acls) >= COMPILED_ACLS_SIZE:
+            compiled_acls.clear()
+        compiled = compiled_acls[key] = CompiledACL(list(acl))
+    return compiled
+
+
+def acl_key(acl) -> tuple:
+    """ hashable form of an acl, permission lists become frozensets """
+    return tuple(
+        (action, principal, frozenset(permissions) if is_like_list(permissions) else permissions)
+        for action, principal, permissions in acl
+    )
+
+
+def as_principals(user_principals: Iterable[str]) -> frozenset:
+    if isinstance(user_principals, frozenset):
+        return user_principals
+    return frozenset(user_principals)
+
+
+# batches
+
+
+async def has_permissions(
+        user_principals: Iterable[str], requested_permission: str, resources: Iterable[Any]
+) -> list[bool]:
+    """ has_permission for many resources of one type, returns a mask
+
+    With "__sql_acl__" the rules are reduced for the principals once: rules
+    not depending on the row are decided up front, a row is only compared on
+    the attributes of the remaining RowPrincipal rules. Otherwise every
+    distinct acl (by "__acl_key__") is evaluated once.
+    """
+    resources = list(resources)
+    if not resources:
+        return []
+    principals = as_principals(user_principals)
+
+    row_rules = reduce_sql_acl(type(resources[0]), principals, requested_permission)
+    if row_rules is not None:
+        if not row_rules:
+            return [False] * len(resources)
+        allow, attr, _ = row_rules[0]
+        if attr is None:
+            return [allow] * len(resources)
+        return [row_allows(row_rules, resource) for resource in resources]
+
+    decisions = {}
+    mask = []
+    for resource in resources:
+        key = resource_key(resource)
+        decision = decisions.get(key) if key is not None else None
+        if decision is None:
+            compiled = await compiled_acl_of(resource)
+            decision = compiled.allows(principals, requested_permission)
+            if key is not None:
+                decisions[key] = decision
+        mask.append(decision)
+    return mask
+
+
+def reduce_sql_acl(model: Any, principals: frozenset, requested_permission: str):
+    """ "__sql_acl__" reduced for the principals, as [(allowed, attr, values)]
+
+    attr is None for a rule matching every row, it is the last one. Returns
+    None without "__sql_acl__" or when a rule needs the database (joins).
+    """
+    sql_acl = getattr(model, "__sql_acl__", None)
+    if sql_acl is None:
+        return None
+
+    reduced = []
+    for action, principal in rules_for(sql_acl(), requested_permission):
+        if isinstance(principal, str):
+            if principal in principals:
+                reduced.append((action == Allow, None, None))
+                break
+            continue
+        prefix, match = principal.prefix, principal.match
+        attr = getattr(match, "key", None) if hasattr(match, "in_") else None
+        if attr is None:
+            return None
+        values = frozenset(p[len(prefix):] for p in principals if p.startswith(prefix))
+        if values:
+            reduced.append((action == Allow, attr, values))
+    return reduced
+
+
+def row_allows(row_rules, resource: Any) -> bool:
+    for allow, attr, values in row_rules:
+        if attr is None or getattr(resource, attr) in values:
+            return allow
+    return False
+
+
+# acls in sql
+
+
+def acl_filter(model: Any, user_principals: Iterable[str], requested_permission: str):
+    """ where clause selecting the rows of a model the user has the permission for
+
+    The model declares its acl for whole tables in a "__sql_acl__" classmethod,
+    like "__acl__" but principals that come from the row are RowPrincipal.
+    Rules are folded from the last one, so the first matching rule decides as
+    in has_permission, and rules not depending on the row become constants.
+
+    returns None if the model has no "__sql_acl__"
+    """
+    sql_acl = getattr(model, "__sql_acl__", None)
+    if sql_acl is None:
+        return None
+    principals = as_principals(user_principals)
+
+    clause = false()
+    for action, principal in reversed(rules_for(sql_acl(), requested_permission)):
+        matched = row_match(principal, principals)
+        if isinstance(matched, False_):
+            continue
+        if isinstance(matched, True_):
+            clause = true() if action == Allow else false()
+        elif action == Allow:
+            clause = matched if isinstance(clause, False_) else or_(matched, clause)
+        elif not isinstance(clause, False_):
+            clause = and_(not_(matched), clause)
+    return clause
+
+
+def rules_for(acl, requested_permission: str) -> list[tuple[str, Any]]:
+    """ (action, principal) of the rules applying to a permission, in order """
+    rules = []
+    for action, principal, permissions in acl:
+        if isinstance(permissions, str):
+            permissions = {permissions}
+        if requested_permission in permissions:
+            rules.append((action, principal))
+    return rules
+
+
+def row_match(principal: Any, principals: frozenset):
+    if isinstance(principal, str):
+        return true() if principal in principals else false()
+    prefix, match = principal.prefix, principal.match
+    values = [p[len(prefix):] for p in principals if p.startswith(prefix)]
+    if not values:
+        return false()
+    return match.in_(values) if hasattr(match, "in_") else match(values)
+
+
 # utility functions
 
 
@@ -214,9 +514,17 @@ async def normalize_acl(resource: Any):
     An existing __acl__ attribute takes precedence before checking if it is an
     iterable.
     """
+    acl = acl_of(resource)
+    return await acl if iscoroutine(acl) else acl
+
+
+def acl_of(resource: Any):
+    """ normalize_acl without awaiting, an async __acl__ gives its coroutine back
+
+    Checking the result is cheaper than inspecting the function on every call,
+    and the permission checks save a coroutine per call.
+    """
     acl = getattr(resource, "__acl__", None)
-    if iscoroutinefunction(acl):
-        return await acl()
     if callable(acl):
         return acl()
     elif acl is not None:
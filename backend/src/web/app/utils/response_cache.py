@@ -0,0 +1,57 @@
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional, Union
+
+from fastapi import Request, Response
+
+from crud import etag_matches, not_modified
+from storage.cache.keys import response_key
+from storage.cache.redis_client import RedisClient
+from ..dependencies.redis import get_redis
+from . import metrics
+
+
+def response_cache_key(tag: str, principals: Iterable[str], request: Request) -> str:
+    # same principals see the same rows, the query is sorted so its order doesn't split entries
+    query = sorted(request.query_params.multi_items())
+    digest = hashlib.blake2b(repr((sorted(map(str, principals)), request.url.path, query)).encode(),
+                             digest_size=16).hexdigest()
+    return response_key(tag, digest)
+
+
+async def cached_response(tag: str, key: str, request: Request) -> tuple[Optional[Response], str]:
+    """The cached response if any, and the generation of the tag to pass to cache_response"""
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: RedisClient
+        cached, generation = await redis.cached_response(tag, key)
+    if not cached:
+        metrics.incr('response_cache.misses')
+        return None, generation
+
+    metrics.incr('response_cache.hits')
+    etag = cached.get('etag')
+    if etag is not None and etag_matches(request, etag):
+        return not_modified(etag), generation
+    return Response(cached['body'], media_type='application/json',
+                    headers={'ETag': etag} if etag is not None else None), generation
+
+
+async def cache_response(tag: str, key: str, generation: str, body: Union[str, bytes], ttl: int,
+                         etag: Optional[str] = None) -> Response:
+    if isinstance(body, bytes):
+        body = body.decode()
+    mapping = {'body': body}
+    if etag is not None:
+        mapping['etag'] = etag
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: RedisClient
+        # a write committed while the response was made invalidated the tag, it's not stored then
+        if not await redis.cache_response(tag, key, mapping, ttl, generation):
+            metrics.incr('response_cache.stale_fills')
+    return Response(body, media_type='application/json', headers={'ETag': etag} if etag is not None else None)
+
+
+async def invalidate_responses(tag: str) -> None:
+    async with asynccontextmanager(get_redis)() as redis:
+        redis: RedisClient
+        metrics.incr('response_cache.invalidated', await redis.invalidate_responses(tag))
@@ -11,7 +11,8 @@ transport = BearerTransport('auth/jwt/login', scopes={'costumer': 'request bids'
 
 
 def get_strategy():
-    return JWTStrategy(secret=settings.JWT_PRIVATE_KEY, lifetime_seconds=timedelta(minutes=30), refresh_token_lifetime=timedelta(days=30))
+    return JWTStrategy(secret=settings.JWT_PRIVATE_KEY, lifetime_seconds=timedelta(seconds=settings.ACCESS_TOKEN_LIFETIME),
+                       refresh_token_lifetime=timedelta(seconds=settings.REFRESH_TOKEN_LIFETIME))
 
 
 backend = AuthenticationBackend(name='jwt', get_strategy=get_strategy, transport=transport)
@@ -0,0 +1,61 @@
+"""Compares the response_model path of FastAPI with the Serializer of CrudAPIRouter(fast_serialization=True).
+
+    python -m web.benchmarks.serialization --rows 1000 --number 50
+
+Runs in process, no database or Redis needed.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from crud import Serializer
+from storage.db.models import User, File
+from ..app.schemas.users import ReadUser
+from ..app.schemas.files import FileRead
+
+
+def users(rows: int):
+    return [User(id=i, login=f'user{i}', phone=str(i), password='', first_name='First', middle_name='Middle',
+                 last_name='Last', is_superuser=False, is_active=True, is_verified=i % 2 == 0)
+            for i in range(rows)]
+
+
+def files(rows: int):
+    return [File(id=i, name=f'file{i}', file_path=f'/static/file{i}') for i in range(rows)]
+
+
+def bench(name: str, func, rows: int, number: int):
+    func()
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    elapsed = (time.perf_counter() - started) / number
+    print(f'{name:<28} {elapsed / rows * 1000 * 1e3:8.2f} ms/1000 rows {rows / elapsed:12,.0f} rows/s')
+
+
+def main(rows: int, number: int):
+    for schema, objs in ((ReadUser, users(rows)), (FileRead, files(rows))):
+        field = create_model_field(name='Response', type_=list[schema], mode='serialization')
+        serializer = Serializer(schema)
+
+        def response_model():
+            # what FastAPI does with a returned list: validate, dump to python, json.dumps
+            content = asyncio.run(serialize_response(field=field, response_content=objs))
+            return JSONResponse(content).body
+
+        assert JSONResponse(serializer.many.dump_python(
+            serializer.many.validate_python(objs, from_attributes=True), mode='json')).body == response_model()
+        bench(f'{schema.__name__} response_model', response_model, rows, number)
+        bench(f'{schema.__name__} serializer', lambda: serializer.dump_many(objs), rows, number)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='resources per response')
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+    main(args.rows, args.number)
@@ -0,0 +1,55 @@
+"""Reports Redis memory per stored session.
+
+    python -m web.benchmarks.sessions --users 10000 --sessions-per-user 3 --db 15
+
+Sessions are written for user ids far above the real ones and removed afterwards.
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import time
+
+from storage.cache.keys import user_sessions_key, principals_key
+from storage.cache.redis_client import RedisClient
+from ..app.conf import settings
+
+FIRST_USER_ID = 10 ** 9
+REFRESH_TTL = 30 * 24 * 3600
+
+
+async def main(users: int, sessions_per_user: int, db: int):
+    redis = RedisClient(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=db, decode_responses=True)
+    principals = json.dumps({'roles': ['role:costumer'], 'rv': 0})
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+    sid = FIRST_USER_ID
+    try:
+        for user_id in user_ids:
+            for _ in range(sessions_per_user):
+                sid += 1
+                value = f'{int(time.time()) + REFRESH_TTL}:{secrets.token_urlsafe(12)}'
+                await redis.open_session(user_id, value, principals, REFRESH_TTL, sid)
+
+        session_bytes = principals_bytes = 0
+        for user_id in user_ids:
+            session_bytes += await redis.memory_usage(user_sessions_key(user_id), samples=0)
+            principals_bytes += await redis.memory_usage(principals_key(user_id), samples=0)
+    finally:
+        for user_id in user_ids:
+            await redis.delete(user_sessions_key(user_id), principals_key(user_id))
+        await redis.aclose()
+
+    total = users * sessions_per_user
+    print(f'sessions:            {total}')
+    print(f'session index bytes: {session_bytes} ({session_bytes / total:.1f} per session)')
+    print(f'principals bytes:    {principals_bytes} ({principals_bytes / users:.1f} per user)')
+    print(f'total per session:   {(session_bytes + principals_bytes) / total:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--sessions-per-user', type=int, default=3)
+    parser.add_argument('--db', type=int, default=15)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.sessions_per_user, args.db))
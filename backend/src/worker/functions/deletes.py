@@ -0,0 +1,31 @@
+from logging import getLogger
+from typing import Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from storage.cache.redis_client import RedisClient
+from storage.db.deletes import delete_in_chunks, count_rows, USER_EVENT_COLUMNS
+
+logger = getLogger(__name__)
+
+
+async def delete_all(ctx, *, table: str, chunk_size: int, exclude_id: int | None = None,
+                     user_events: bool = False, cache_tags: Sequence[str] = ()):
+    """DELETE /{resource}/ of tables too big to empty within a request, progress goes to the job"""
+    job = ctx['job']
+    redis: RedisClient = ctx['redis']
+
+    async def on_chunk(rows, deleted: int):
+        if user_events:
+            await redis.broadcast_users_cud_actions(rows, 'delete')
+        for tag in cache_tags:
+            await redis.invalidate_responses(tag)
+        await job.update(progress=min(deleted / total, 1.0) if total else 0.0, meta={'deleted': deleted})
+
+    async with ctx['async_session_maker']() as session:
+        session: AsyncSession
+        total = await count_rows(session, table)
+        deleted = await delete_in_chunks(session, table, chunk_size, exclude_id,
+                                         USER_EVENT_COLUMNS if user_events else (), on_chunk)
+    logger.info('Deleted %d rows of %s', deleted, table)
+    return {'deleted': deleted}
@@ -0,0 +1,70 @@
+from logging import getLogger
+
+from sqlalchemy import Integer, table, column, delete, select, func, values, exists
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from storage.cache.keys import PENDING_SESSIONS, REVOKED_SESSIONS
+
+logger = getLogger(__name__)
+
+# The worker doesn't ship the web models, lightweight tables are enough for core statements
+sessions = table('sessions', column('id'), column('user_id'))
+users = table('users', column('id'))
+
+BATCH_SIZE = 1000
+
+
+async def read_queue(redis, key: str) -> list[str]:
+    # entries are only read here and trimmed once the transaction is committed, a failed
+    # flush leaves them for the next one. Producers only RPUSH, the head is ours
+    length = await redis.llen(key)
+    entries = []
+    for start in range(0, length, BATCH_SIZE):
+        entries.extend(await redis.lrange(key, start, min(start + BATCH_SIZE, length) - 1))
+    return entries
+
+
+async def flush_sessions(ctx):
+    """Writes sessions opened and closed in Redis to the sessions table"""
+    redis = ctx['redis']
+    # Revoked ids are taken first: a session opened and closed since the last flush is never inserted
+    revoked_entries = await read_queue(redis, REVOKED_SESSIONS)
+    pending_entries = await read_queue(redis, PENDING_SESSIONS)
+    revoked = {int(sid) for sid in revoked_entries}
+
+    inserted = 0
+    async with ctx['async_session_maker']() as session:
+        session: AsyncSession
+        rows = []
+        for entry in pending_entries:
+            sid, user_id = map(int, entry.split(':'))
+            if sid not in revoked:
+                rows.append((sid, user_id))
+
+        for start in range(0, len(rows), BATCH_SIZE):
+            pending = values(column('id', Integer), column('user_id', Integer),
+                             name='pending').data(rows[start:start + BATCH_SIZE])
+            # users deleted before the flush take their sessions with them
+            stmt = insert(sessions).from_select(
+                ['id', 'user_id'],
+                select(pending.c.id, pending.c.user_id).where(exists().where(users.c.id == pending.c.user_id)),
+            ).on_conflict_do_nothing()
+            inserted += (await session.execute(stmt)).rowcount
+
+        if revoked:
+            await session.execute(delete(sessions).where(sessions.c.id.in_(revoked)))
+        if inserted:
+            # Keep the sequence ahead of the Redis allocated ids for the database session store
+            await session.execute(
+                select(func.setval('sessions_id_seq', select(func.max(sessions.c.id)).scalar_subquery()))
+            )
+        await session.commit()
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.ltrim(REVOKED_SESSIONS, len(revoked_entries), -1)
+        pipe.ltrim(PENDING_SESSIONS, len(pending_entries), -1)
+        await pipe.execute()
+
+    if inserted or revoked:
+        logger.info('Flushed %d new and %d revoked sessions', inserted, len(revoked))
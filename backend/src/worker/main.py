@@ -3,6 +3,9 @@ from saq import CronJob, Queue
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from logging import getLogger, basicConfig, INFO, DEBUG
 from .settings import settings as conf_settings
+from .functions.sessions import flush_sessions
+from .functions.deletes import delete_all
+from storage.cache.redis_client import RedisClient
 
 logger = getLogger(__name__)
 
@@ -26,10 +29,11 @@ async def startup(ctx):
     engine = create_async_engine(conf_settings.SQLALCHEMY_DATABASE_URL, echo=False)
     async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
     ctx["async_session_maker"] = async_session_maker
+    ctx["redis"] = RedisClient(host=conf_settings.REDIS_HOST, port=conf_settings.REDIS_PORT, decode_responses=True)
 
 
 async def shutdown(ctx):
-    pass
+    await ctx["redis"].aclose()
     # await ctx["db"].disconnect()
 
 
@@ -46,9 +50,10 @@ queue = Queue.from_url(f'redis://{conf_settings.REDIS_HOST}')
 
 settings = {
     "queue": queue,
-    "functions": [test],
+    "functions": [test, delete_all],
     "concurrency": 10,
-    "cron_jobs": [CronJob(cron, cron="* * * * * */5")],  # run every 5 seconds
+    "cron_jobs": [CronJob(cron, cron="* * * * * */5"),  # run every 5 seconds
+                  CronJob(flush_sessions, cron="* * * * * */5")],
     "startup": startup,
     "shutdown": shutdown,
     "before_process": before_process,